@@ -0,0 +1,53 @@
+import tempfile
+import time
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.als import train_explicit_als_ooc
+from src.utils.data_loading import save_csr_npy, synthetic_split, transpose_csr_npy
+
+# Out-of-core ALS: the ratings are written to memory-mapped .npy shards
+# (user-major + item-major) and the trainer streams them in row blocks, so
+# the heap only holds the factors and one block. The table reports anonymous
+# (heap) RSS from /proc, which excludes the clean, droppable mapped file pages.
+
+k = 32
+lam = 0.05
+n_iter = 3
+block_nnz = 1 << 20
+
+tmp = tempfile.TemporaryDirectory()
+path = tmp.name
+R_train, _ = synthetic_split(200_000, 20_000, 8_000_000, seed=0)
+R_train.data -= R_train.data.mean()
+m, n = R_train.shape
+nnz = R_train.nnz
+save_csr_npy(R_train, os.path.join(path, "users"))
+del R_train
+transpose_csr_npy(os.path.join(path, "users"), os.path.join(path, "items"), block_nnz=block_nnz)
+print(f"synthetic: {m} users × {n} items, {nnz} ratings, k={k}, block_nnz={block_nnz}")
+
+
+def anon_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+print(f"factors: {(m + n) * k * 8 / 2**20:.0f} MB, ratings on disk: {nnz * 12 / 2**20:.0f} MB, "
+      f"heap before training: {anon_rss_mb():.0f} MB")
+
+
+def report(info):
+    print(f"iter {info['iteration']}  {info['seconds']:.2f}s  loss={info['loss']:.1f}  heap RSS {anon_rss_mb():.0f} MB")
+
+
+try:
+    t0 = time.perf_counter()
+    train_explicit_als_ooc(os.path.join(path, "users"), os.path.join(path, "items"), k=k, lam=lam, n_iter=n_iter,
+                           solver="batched", block_nnz=block_nnz, callback=report)
+    print(f"total {time.perf_counter() - t0:.2f}s")
+finally:
+    tmp.cleanup()
@@ -0,0 +1,36 @@
+import time
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# one BLAS thread per process, so the table measures process-level scaling
+for var in ("OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "OMP_NUM_THREADS"):
+    os.environ.setdefault(var, "1")
+
+from src.als import train_simple_explicit_als, train_simple_explicit_biased_als
+from src.utils.data_loading import synthetic_split
+
+# Wall-clock scaling of ALS training from 1 to N worker processes
+# (n_jobs), for the explicit and biased trainers.
+
+k = 32
+lam = 0.05
+n_iter = 3
+solver = "batched"
+
+R_train, _ = synthetic_split(100_000, 20_000, 4_000_000, seed=0)
+print(f"synthetic: {R_train.shape[0]} users × {R_train.shape[1]} items, {R_train.nnz} ratings, "
+      f"k={k}, iters={n_iter}, solver={solver}")
+
+n_cpu = os.cpu_count()
+jobs = sorted({1, 2, 4, 8, 16, n_cpu} & set(range(1, n_cpu + 1)))
+
+for name, trainer in [("explicit", train_simple_explicit_als), ("biased", train_simple_explicit_biased_als)]:
+    base = None
+    print(f"\n{name}")
+    print(f"{'n_jobs':>6} {'seconds':>8} {'speedup':>8}")
+    for n_jobs in jobs:
+        t0 = time.perf_counter()
+        trainer(R_train, k=k, lam=lam, n_iter=n_iter, seed=42, solver=solver, n_jobs=n_jobs)
+        dt = time.perf_counter() - t0
+        base = base or dt
+        print(f"{n_jobs:>6} {dt:>8.2f} {base / dt:>7.2f}x")
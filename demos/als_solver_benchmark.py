@@ -0,0 +1,52 @@
+import time
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from src.als import train_simple_explicit_als
+from src.utils.data_loading import load_split, synthetic_split
+
+# Per-iteration timing of the ALS solvers. Iterations are run one at a time,
+# warm-starting from the previous factors, so each row of the table is the
+# cost of a single user + item sweep.
+
+k = 64
+lam = 0.05
+n_iter = 8
+solvers = ["loop", "batched", "cg"]
+
+
+def test_rmse(R_test, X, Y, offset=0.0):
+    coo = R_test.tocoo()
+    pred = np.clip(offset + np.sum(X[coo.row] * Y[coo.col], axis=1), 1, 5)
+    return np.sqrt(np.mean((coo.data + offset - pred) ** 2))
+
+
+def run(name, R_train, R_test, offset=0.0):
+    m, n = R_train.shape
+    print(f"\n{name}: {m} users × {n} items, {R_train.nnz} ratings, k={k}")
+    print(f"{'solver':>8} {'iter':>4} {'seconds':>8} {'test RMSE':>10}")
+    for solver in solvers:
+        rng = np.random.default_rng(42)
+        X = 0.01 * rng.standard_normal((m, k))
+        Y = 0.01 * rng.standard_normal((n, k))
+        total = 0.0
+        for it in range(n_iter):
+            t0 = time.perf_counter()
+            X, Y = train_simple_explicit_als(R_train, k=k, lam=lam, n_iter=1, init_X=X, init_Y=Y, solver=solver)
+            dt = time.perf_counter() - t0
+            total += dt
+            print(f"{solver:>8} {it:>4} {dt:>8.3f} {test_rmse(R_test, X, Y, offset):>10.4f}")
+        print(f"{solver:>8} {'all':>4} {total:>8.3f}")
+
+
+if os.path.exists("data/raw/ml-100k/u1.base"):
+    R_train, R_test, *_, global_mean = load_split("data/raw/ml-100k/u1.base", "data/raw/ml-100k/u1.test", mean_centered=True)
+    run("ml-100k", R_train, R_test, offset=global_mean)
+
+R_train, R_test = synthetic_split(50_000, 10_000, 2_000_000, seed=0)
+offset = R_train.data.mean()
+R_train.data -= offset
+R_test.data -= offset
+run("synthetic", R_train, R_test, offset=offset)
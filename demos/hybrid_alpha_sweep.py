@@ -0,0 +1,49 @@
+import time
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import pandas as pd
+
+from src.als import train_simple_explicit_biased_als
+from src.hybrid import evaluate_hybrid, sweep_hybrid
+from src.utils.data_loading import load_split, synthetic_split
+
+# Tuning alpha for the CF + genre hybrid: one evaluate_hybrid call per alpha
+# against a single sweep_hybrid pass that scores every block of users once
+# and evaluates all the blends on it.
+
+alphas = np.round(np.linspace(0, 1, 21), 2).tolist()
+ks = [10, 20]
+item_cols = [f'genre_{i}' for i in range(19)]
+
+if os.path.exists("data/raw/ml-100k/u.item"):
+    name = "ml-100k"
+    R_train, R_test, *_ = load_split("data/raw/ml-100k/u1.base", "data/raw/ml-100k/u1.test")
+    items = pd.read_csv('data/raw/ml-100k/u.item', sep='|', names=['movie_id','title','release_date','video_release','IMDb_URL'] + item_cols, encoding='latin-1')
+else:
+    name = "synthetic"
+    R_train, R_test = synthetic_split(943, 1682, 100_000, seed=0)
+    rng = np.random.default_rng(0)
+    items = pd.DataFrame((rng.random((1682, 19)) < 0.1).astype(int), columns=item_cols)
+    items.insert(0, "movie_id", np.arange(1, 1683))
+
+mu, bu, bi, X, Y = train_simple_explicit_biased_als(R_train, k=30, lam=0.05, lam_bias=0.05, n_iter=12, seed=42)
+print(f"{name}: {R_train.shape[0]} users × {R_train.shape[1]} items, {len(alphas)} alphas, k in {ks}")
+
+t0 = time.perf_counter()
+for alpha in alphas:
+    for k in ks:
+        evaluate_hybrid(R_train, R_test, mu, bu, bi, X, Y, items, item_cols, alpha=alpha, k=k)
+t_loop = time.perf_counter() - t0
+
+t0 = time.perf_counter()
+table = sweep_hybrid(R_train, R_test, mu, bu, bi, X, Y, items, item_cols, alphas, ks)
+t_sweep = time.perf_counter() - t0
+
+t0 = time.perf_counter()
+evaluate_hybrid(R_train, R_test, mu, bu, bi, X, Y, items, item_cols, alpha=0.5, k=10)
+t_one = time.perf_counter() - t0
+
+print(f"one evaluate_hybrid: {t_one:.2f} s, {len(alphas) * len(ks)} calls: {t_loop:.2f} s, sweep_hybrid: {t_sweep:.2f} s")
+print(table.sort_values("ndcg", ascending=False).head(5).to_string(index=False))
@@ -0,0 +1,35 @@
+import time
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.knn import fit_item_knn, recommend_item_knn
+from src.metrics.evaluate import _ground_truth, evaluate
+from src.utils.data_loading import load_split, synthetic_split
+from src.utils.similarities import adjusted_cosine_similarity, cosine_similarity, pearson_similarity
+
+# Item-item KNN top-k recommendation: the neighbour index is built once
+# (offline) and serving every user is one sparse product per block of users.
+
+k = 10
+n_neighbors = 50
+
+if os.path.exists("data/raw/ml-100k/u1.base"):
+    name = "ml-100k"
+    R_train, R_test, *_ = load_split("data/raw/ml-100k/u1.base", "data/raw/ml-100k/u1.test")
+else:
+    name = "synthetic"
+    R_train, R_test = synthetic_split(20_000, 5_000, 800_000, seed=0)
+
+print(f"{name}: {R_train.shape[0]} users × {R_train.shape[1]} items, {R_train.nnz} ratings, "
+      f"n_neighbors={n_neighbors}, k={k}")
+truth = _ground_truth(R_test)
+print(f"{'similarity':>28} {'fit s':>7} {'recommend s':>12} {'ndcg':>7} {'recall':>7}")
+for similarity_func in [cosine_similarity, adjusted_cosine_similarity, pearson_similarity]:
+    t0 = time.perf_counter()
+    neighbours = fit_item_knn(R_train, similarity_func, n_neighbors=n_neighbors)
+    t_fit = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    recs = recommend_item_knn(R_train, neighbours, k=k)
+    t_rec = time.perf_counter() - t0
+    res = evaluate(recs.tolist(), truth, k, R_train.shape[1])
+    print(f"{similarity_func.__name__:>28} {t_fit:>7.2f} {t_rec:>12.2f} {res['ndcg']:>7.4f} {res['recall']:>7.4f}")
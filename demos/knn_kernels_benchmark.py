@@ -0,0 +1,68 @@
+import time
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from src.knn import RatingsIndex, knn_predict_item, knn_predict_item_batch, knn_predict_user, knn_predict_user_batch
+from src.utils import kernels
+from src.utils.data_loading import load_split, synthetic_split
+
+# Per-kernel timings of src/utils/kernels.py: the NumPy versions against the
+# numba-compiled loops (when numba is installed), on the rows of the
+# training matrix. Compilation happens on a warm-up call and is not timed.
+# The second table times whole predictions through a RatingsIndex (built
+# once, not timed), so the kernels can be seen against everything around
+# them: one call per pair, then the batch predictor on the same pairs.
+
+n_calls = 200
+
+if os.path.exists("data/raw/ml-100k/u1.base"):
+    name = "ml-100k"
+    R, *_ = load_split("data/raw/ml-100k/u1.base", "data/raw/ml-100k/u1.test")
+else:
+    name = "synthetic"
+    R, _ = synthetic_split(20_000, 5_000, 1_000_000, seed=0)
+Rt = R.T.tocsr()
+print(f"{name}: {R.shape[0]} users × {R.shape[1]} items, {R.nnz} ratings, numba: "
+      f"{'yes' if kernels.HAS_NUMBA else 'not installed'}")
+
+rng = np.random.default_rng(0)
+rows = rng.integers(0, R.shape[0], n_calls)
+moment_args = [(Rt.indptr, Rt.indices, Rt.data, R.indices[R.indptr[r]:R.indptr[r+1]],
+                R.data[R.indptr[r]:R.indptr[r+1]], R.shape[0]) for r in rows]
+# one candidate list per call: every user, with a similarity and a rating
+top_k_args = [(np.arange(R.shape[0]), rng.random(R.shape[0]), rng.integers(1, 6, R.shape[0]).astype(float), 10)
+              for _ in range(n_calls)]
+
+kernel_cases = [("co_rated_moments", kernels._co_rated_moments_numpy, kernels._co_rated_moments_loop, moment_args),
+                ("top_k_average", kernels._top_k_average_numpy, kernels._top_k_average_loop, top_k_args)]
+
+
+def per_call_ms(func, calls):
+    func(*calls[0])
+    t0 = time.perf_counter()
+    for args in calls:
+        func(*args)
+    return (time.perf_counter() - t0) / len(calls) * 1e3
+
+
+print(f"{'kernel':>18} {'numpy ms':>9} {'numba ms':>9} {'speedup':>8}")
+for kernel, numpy_version, loop_version, calls in kernel_cases:
+    t_numpy = per_call_ms(numpy_version, calls)
+    if kernels.HAS_NUMBA:
+        t_numba = per_call_ms(kernels.numba.njit(loop_version), calls)
+        print(f"{kernel:>18} {t_numpy:>9.3f} {t_numba:>9.3f} {t_numpy / t_numba:>7.1f}x")
+    else:
+        print(f"{kernel:>18} {t_numpy:>9.3f} {'-':>9} {'-':>8}")
+
+
+index = RatingsIndex(R)
+items = rng.integers(0, R.shape[1], n_calls)
+print(f"{'predictor':>18} {'ms/pair':>9} {'batch ms/pair':>14}")
+for predict, batch in ((knn_predict_user, knn_predict_user_batch), (knn_predict_item, knn_predict_item_batch)):
+    t_single = per_call_ms(predict, [(index, u, i) for u, i in zip(rows, items)])
+    t0 = time.perf_counter()
+    batch(index, rows, items)
+    t_batch = (time.perf_counter() - t0) / n_calls * 1e3
+    print(f"{predict.__name__:>18} {t_single:>9.3f} {t_batch:>14.3f}")
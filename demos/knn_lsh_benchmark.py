@@ -0,0 +1,80 @@
+import time
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from scipy import sparse
+
+from src.knn import fit_user_knn, knn_predict_user_batch
+from src.utils.data_loading import load_split, synthetic_split
+from src.utils.lsh import HyperplaneLSH
+from src.utils.similarities import cosine_similarity
+
+# Exact vs LSH neighbour selection for user KNN: fit time, candidate pairs
+# scored, recall and the test RMSE of the resulting predictor. "hashed" is
+# the share of the exact top-N under the quantity the index hashes (cosine
+# between whole mean-centered rows, missing = 0) that are candidates;
+# "recall" is the share of the exact co-rated cosine neighbours the
+# approximate fit keeps. More tables -> higher recall, more bits -> fewer
+# candidates.
+
+n_neighbors = 30
+k = 10
+similarity_func = cosine_similarity
+configs = [(2, 10), (4, 8), (8, 8), (8, 6), (16, 6), (16, 4)]
+
+if os.path.exists("data/raw/ml-100k/u1.base"):
+    name = "ml-100k"
+    R_train, R_test, *_ = load_split("data/raw/ml-100k/u1.base", "data/raw/ml-100k/u1.test")
+else:
+    name = "synthetic"
+    R_train, R_test = synthetic_split(4_000, 1_500, 250_000, seed=0)
+
+m, n = R_train.shape
+print(f"{name}: {m} users × {n} items, {R_train.nnz} ratings, "
+      f"{similarity_func.__name__}, n_neighbors={n_neighbors}, k={k}")
+
+dense = np.full(R_train.shape, np.nan)
+coo = R_train.tocoo()
+dense[coo.row, coo.col] = coo.data
+test = R_test.tocoo()
+
+
+def hashed_top_n(R, n):
+    # exact top-n of every row by whole-row centered cosine, as pair keys
+    X = sparse.csr_matrix(R, dtype=float, copy=True)
+    counts = np.diff(X.indptr)
+    X.data -= np.repeat(np.asarray(X.sum(axis=1)).ravel() / np.maximum(counts, 1), counts)
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    X = sparse.diags(1 / np.where(norms > 0, norms, 1)) @ X
+    S = (X @ X.T).toarray()
+    np.fill_diagonal(S, -np.inf)
+    top = np.argpartition(-S, n, axis=1)[:, :n]
+    return np.repeat(np.arange(R.shape[0]), n) * R.shape[0] + top.ravel()
+
+
+def rmse(neighbours):
+    pred = knn_predict_user_batch(dense, test.row, test.col, k=k, neighbours=neighbours)
+    ok = ~np.isnan(pred)
+    return np.sqrt(np.mean((pred[ok] - test.data[ok]) ** 2)), ok.mean()
+
+
+t0 = time.perf_counter()
+exact = fit_user_knn(R_train, similarity_func, n_neighbors=n_neighbors)
+t_exact = time.perf_counter() - t0
+err, cov = rmse(exact)
+hashed = hashed_top_n(R_train, n_neighbors)
+print(f"{'index':>14} {'fit s':>7} {'pairs/user':>10} {'hashed':>7} {'recall':>7} {'RMSE':>7} {'coverage':>8}")
+print(f"{'exact':>14} {t_exact:>7.2f} {m - 1:>10} {1.0:>7.3f} {1.0:>7.3f} {err:>7.4f} {cov:>8.3f}")
+
+for n_tables, n_bits in configs:
+    index = HyperplaneLSH(n_tables=n_tables, n_bits=n_bits, max_bucket=100, seed=0)
+    t0 = time.perf_counter()
+    approx = fit_user_knn(R_train, similarity_func, n_neighbors=n_neighbors, index=index)
+    dt = time.perf_counter() - t0
+    rows, cols = index.candidate_pairs()
+    pairs = rows.size / m
+    hashed_recall = np.isin(hashed, rows * m + cols).mean()
+    recall = exact.multiply(approx > 0).nnz / exact.nnz
+    err, cov = rmse(approx)
+    print(f"{f'{n_tables}x{n_bits} bits':>14} {dt:>7.2f} {pairs:>10.0f} {hashed_recall:>7.3f} {recall:>7.3f} {err:>7.4f} {cov:>8.3f}")
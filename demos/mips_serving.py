@@ -0,0 +1,83 @@
+import time
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from src.als import train_simple_explicit_biased_als
+from src.mips import MIPSIndex
+from src.utils.data_loading import load_split, synthetic_split
+
+# Serving top-10 from biased ALS factors: brute force X[u] @ Y.T over the
+# whole catalog against MIPSIndex, exact and with n_probe clusters, one user
+# per call and in batches of `batch` users. Reports per-user latency, items
+# scanned and recall of the exact top-10.
+
+k = 10
+n_queries = 500
+batch = 100
+
+if os.path.exists("data/raw/ml-100k/u1.base"):
+    name = "ml-100k"
+    R_train, *_ = load_split("data/raw/ml-100k/u1.base", "data/raw/ml-100k/u1.test")
+else:
+    name = "synthetic"
+    R_train, _ = synthetic_split(20_000, 50_000, 1_000_000, seed=0)
+
+mu, bu, bi, X, Y = train_simple_explicit_biased_als(R_train, k=32, lam=0.1, lam_bias=0.1, n_iter=5, seed=0, solver="batched")
+n_items = Y.shape[0]
+users = np.random.default_rng(0).choice(R_train.shape[0], min(n_queries, R_train.shape[0]), replace=False)
+seen = [R_train[u].indices for u in users]
+
+
+def brute_force(u, exclude):
+    scores = mu + bu[u] + bi + Y @ X[u]
+    scores[exclude] = -np.inf
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+t0 = time.perf_counter()
+truth = [brute_force(u, s) for u, s in zip(users, seen)]
+t_brute = (time.perf_counter() - t0) / len(users) * 1e3
+
+def brute_force_batch(block):
+    scores = mu + bu[block][:, None] + bi + X[block] @ Y.T
+    excluded = R_train[block].tocoo()
+    scores[excluded.row, excluded.col] = -np.inf
+    top = np.argpartition(-scores, k, axis=1)[:, :k]
+    return np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+
+
+t0 = time.perf_counter()
+for lo in range(0, len(users), batch):
+    brute_force_batch(users[lo:lo + batch])
+t_brute_batch = (time.perf_counter() - t0) / len(users) * 1e3
+
+t0 = time.perf_counter()
+index = MIPSIndex(X, Y, bu=bu, bi=bi, mu=mu)
+t_build = time.perf_counter() - t0
+print(f"{name}: {n_items} items, {len(index.radius)} clusters, index built in {t_build:.2f} s")
+print(f"{'mode':>12} {'ms/user':>8} {'scanned':>8} {'recall':>7} {'batch ms/user':>14} {'scanned':>8} {'recall':>7}")
+print(f"{'brute force':>12} {t_brute:>8.3f} {n_items:>8} {1.0:>7.3f} {t_brute_batch:>14.3f} {n_items:>8} {1.0:>7.3f}")
+
+for n_probe in [None, 32, 16, 8]:
+    scanned, hits = 0, 0
+    t0 = time.perf_counter()
+    for u, s, expected in zip(users, seen, truth):
+        items, _ = index.recommend(u, k=k, exclude=s, n_probe=n_probe)
+        scanned += index.last_scanned
+        hits += np.intersect1d(items, expected).size
+    dt = (time.perf_counter() - t0) / len(users) * 1e3
+
+    batch_scanned, batch_hits = 0, 0
+    t0 = time.perf_counter()
+    for lo in range(0, len(users), batch):
+        items, _ = index.recommend_batch(users[lo:lo + batch], k=k, exclude=R_train, n_probe=n_probe)
+        batch_scanned += index.last_scanned
+        batch_hits += sum(np.intersect1d(row, expected).size for row, expected in zip(items, truth[lo:lo + batch]))
+    dt_batch = (time.perf_counter() - t0) / len(users) * 1e3
+
+    mode = "exact" if n_probe is None else f"n_probe={n_probe}"
+    print(f"{mode:>12} {dt:>8.3f} {scanned / len(users):>8.0f} {hits / (k * len(users)):>7.3f} "
+          f"{dt_batch:>14.3f} {batch_scanned / len(users):>8.0f} {batch_hits / (k * len(users)):>7.3f}")
@@ -0,0 +1,41 @@
+import time
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from src.als import train_simple_explicit_biased_als
+from src.hybrid import compute_cf_scores
+from src.metrics.evaluate import evaluate_XY, rmse_XY
+from src.utils.data_loading import load_split, synthetic_split
+
+# float64 vs float32 for biased ALS training, scoring and top-k evaluation.
+# Falls back to a synthetic split of ml-100k's shape when the data is missing.
+
+if os.path.exists("data/raw/ml-100k/u1.base"):
+    name = "ml-100k u1"
+    R_train, R_test, *_ = load_split("data/raw/ml-100k/u1.base", "data/raw/ml-100k/u1.test")
+else:
+    name = "synthetic 943 × 1682 (ml-100k not downloaded)"
+    R_train, R_test = synthetic_split(943, 1682, 100_000, seed=0)
+
+k = 64
+lam = 0.05
+n_iter = 12
+
+print(name)
+print(f"{'dtype':>8} {'train s':>8} {'eval s':>7} {'RMSE':>7} {'HR@10':>7} {'NDCG@10':>8} {'score MB':>9}")
+for dtype in (np.float64, np.float32):
+    t0 = time.perf_counter()
+    mu, bu, bi, X, Y = train_simple_explicit_biased_als(R_train, k=k, lam=lam, lam_bias=lam, n_iter=n_iter,
+                                                        seed=42, solver="batched", dtype=dtype)
+    t_train = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    rmse = rmse_XY(R_test, X, Y, biased=True, bu=bu, bi=bi, mu=mu)
+    metrics = evaluate_XY(R_train, R_test, X, Y, k=10, biased=True, bu=bu, bi=bi, mu=mu, dtype=dtype)
+    t_eval = time.perf_counter() - t0
+    score_mb = compute_cf_scores(mu, bu, bi, X, Y, dtype=dtype).nbytes / 2**20
+
+    print(f"{np.dtype(dtype).name:>8} {t_train:>8.2f} {t_eval:>7.2f} {rmse:>7.4f} "
+          f"{metrics['hr']:>7.4f} {metrics['ndcg']:>8.4f} {score_mb:>9.1f}")
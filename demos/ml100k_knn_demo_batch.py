@@ -0,0 +1,38 @@
+import time
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from sklearn.metrics import mean_squared_error, mean_absolute_error
+
+from src.utils.similarities import (
+    cosine_similarity, pearson_similarity, euclidean_similarity, manhattan_similarity
+)
+
+from src.knn import knn_predict_item_batch, knn_predict_user_batch
+from src.utils.data_loading import load_split
+
+# All of u1.test in one call per model: pairs are grouped by user (or item),
+# so each similarity row is computed once. Predictions are the same as the
+# per-pair loop in ml100k_knn_demo_slow.py, but the ratings stay in the CSR
+# matrix from load_split (no dense NaN array).
+
+R_train, _, n_users, n_items, train, test, _ = load_split("data/raw/ml-100k/u1.base", "data/raw/ml-100k/u1.test")
+
+k = 10
+users = test.user_id.values - 1
+items = test.item_id.values - 1
+act = test.rating.values
+
+for name, predict in [("User-based", knn_predict_user_batch), ("Item-based", knn_predict_item_batch)]:
+    for similarity_func in [cosine_similarity, pearson_similarity, euclidean_similarity, manhattan_similarity]:
+        t0 = time.perf_counter()
+        pred = predict(R_train, users, items, k=k, similarity_func=similarity_func)
+        elapsed = time.perf_counter() - t0
+        mask = ~np.isnan(pred)
+        rmse = np.sqrt(mean_squared_error(act[mask], pred[mask]))
+        mae = mean_absolute_error(act[mask], pred[mask])
+        print(f"{name} kNN ({similarity_func.__name__}, k={k}): {elapsed:.2f} s, "
+              f"evaluated {mask.sum()} of {len(pred)}, RMSE {rmse:.4f}, MAE {mae:.4f}")
@@ -0,0 +1,47 @@
+import time
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.als import train_simple_explicit_biased_als
+from src.metrics.evaluate import rmse_XY
+from src.sgd import train_sgd_biased_mf
+from src.utils.data_loading import load_split, synthetic_split
+
+# Time-to-quality of the two biased MF trainers: test RMSE after every
+# iteration (ALS) / epoch (SGD) against cumulative training time.
+
+k = 16
+
+
+def trace(R_test):
+    rows = []
+    clock = [0.0]
+
+    def callback(info):
+        clock[0] += info["seconds"]
+        mu, bu, bi, X, Y = info["model"]
+        rows.append((info["iteration"], clock[0], rmse_XY(R_test, X, Y, biased=True, bu=bu, bi=bi, mu=mu)))
+    return rows, callback
+
+
+def run(name, R_train, R_test):
+    print(f"\n{name}: {R_train.shape[0]} users × {R_train.shape[1]} items, {R_train.nnz} ratings, k={k}")
+    trainers = [
+        ("als/batched", lambda cb: train_simple_explicit_biased_als(R_train, k=k, lam=20.0, n_iter=8, solver="batched", callback=cb)),
+        ("als/cg", lambda cb: train_simple_explicit_biased_als(R_train, k=k, lam=20.0, n_iter=8, solver="cg", callback=cb)),
+        ("sgd", lambda cb: train_sgd_biased_mf(R_train, k=k, lr=0.005, lam=0.1, n_epochs=8, batch_size=256, callback=cb)),
+    ]
+    print(f"{'trainer':>12} {'iter':>4} {'seconds':>8} {'test RMSE':>10}")
+    for label, train in trainers:
+        rows, callback = trace(R_test)
+        train(callback)
+        for it, seconds, rmse in rows:
+            print(f"{label:>12} {it:>4} {seconds:>8.2f} {rmse:>10.4f}")
+
+
+if os.path.exists("data/raw/ml-100k/u1.base"):
+    R_train, R_test, *_ = load_split("data/raw/ml-100k/u1.base", "data/raw/ml-100k/u1.test")
+    run("ml-100k", R_train, R_test)
+
+R_train, R_test = synthetic_split(20_000, 5_000, 800_000, seed=0)
+run("synthetic", R_train, R_test)
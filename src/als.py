@@ -1,95 +1,744 @@
+import os
+import time
+from multiprocessing import get_context, shared_memory
+
 import numpy as np
+from scipy.sparse import csr_matrix
+
+from src.metrics.evaluate import evaluate_XY, rmse_XY
+from src.utils.data_loading import load_csr_npy
+
+SOLVERS = ("loop", "batched", "cg")
+
+# rows per stacked solve / per CG block in the batched and cg engines, and the
+# cap on padded (rows × width) slots gathered for a single block
+_BATCH_ROWS = 128
+_CG_BLOCK_ROWS = 1024
+_BLOCK_SLOTS = 1 << 16
+
+# default number of conjugate-gradient steps per half-step for solver="cg"
+CG_STEPS = 3
+
+
+def _solve_rows_loop(indptr, indices, targets, F, out, base, rows, weights):
+    for r in rows:
+        start, end = indptr[r], indptr[r+1]
+        if start == end:
+            continue
+        idx = indices[start:end]
+        F_r = F[idx]
+        if weights is None:
+            A = F_r.T @ F_r + base
+        else:
+            A = F_r.T @ (weights[start:end, None] * F_r) + base
+        b = F_r.T @ targets[start:end]
+        out[r] = np.linalg.solve(A, b)
+
+
+def _padded_blocks(indptr, indices, F, rows, block_rows, *values):
+    # Yield (block, F_b, values_b) for the non-empty rows, where F_b is the
+    # B × width × k stack of gathered factor rows (zero padded) and values_b
+    # the matching B × width gathers of each per-nnz array in `values`. Rows
+    # are sorted by nnz so each block only pads up to the longest row among
+    # rows of similar length, and a block is cut short once B × width would
+    # exceed _BLOCK_SLOTS.
+    rows = rows[indptr[rows + 1] > indptr[rows]]
+    counts = indptr[rows + 1] - indptr[rows]
+    order = np.argsort(counts, kind="stable")
+    rows, counts = rows[order], counts[order]
+
+    s = 0
+    while s < rows.size:
+        e = min(s + block_rows, rows.size)
+        if (e - s) * counts[e - 1] > _BLOCK_SLOTS:
+            # largest e with (e - s) * counts[e - 1] <= _BLOCK_SLOTS (at least one row)
+            lo, hi = s + 1, e
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if (mid - s) * counts[mid - 1] <= _BLOCK_SLOTS:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            e = lo
+        block = rows[s:e]
+        s = e
+
+        starts = indptr[block]
+        offsets = np.arange(counts[e - 1])
+        valid = offsets[None, :] < (indptr[block + 1] - starts)[:, None]
+        pos = np.where(valid, starts[:, None] + offsets[None, :], 0)
+
+        F_b = F[indices[pos]]
+        F_b[~valid] = 0
+        yield block, F_b, [None if v is None else np.where(valid, v[pos], 0) for v in values]
+
+
+def _solve_rows_batched(indptr, indices, targets, F, out, base, rows, weights, dual):
+    # Short rows (width < k) take a width × width path: with dual == "ridge"
+    # (base is lam * I, no weights) the plain dual system, otherwise with
+    # dual = base^-1 the Woodbury form; dual=None always solves the k × k system.
+    k = F.shape[1]
+    blocks = _padded_blocks(indptr, indices, F, rows, _BATCH_ROWS, targets, weights)
+    for block, F_b, (t_b, w_b) in blocks:
+        width = F_b.shape[1]
+        F_bt = F_b.transpose(0, 2, 1)
+        if width < k and isinstance(dual, str):
+            # (F.T F + lam I)^-1 F.T t == F.T (F F.T + lam I)^-1 t
+            G = F_b @ F_bt + base[0, 0] * np.eye(width, dtype=F_b.dtype)
+            out[block] = (F_bt @ np.linalg.solve(G, t_b[..., None]))[..., 0]
+        elif width < k and dual is not None:
+            # Woodbury with H = base^-1:
+            # (base + F.T W F)^-1 b == H b - H F.T (W^-1 + F H F.T)^-1 F H b
+            FH = F_b @ dual
+            Hb = (t_b[:, None, :] @ FH)[:, 0]
+            S = FH @ F_bt
+            if w_b is None:
+                w_inv = 1.0
+            else:
+                w_inv = np.divide(1.0, w_b, out=np.ones_like(w_b), where=w_b != 0)
+            S[:, np.arange(width), np.arange(width)] += w_inv
+            z = np.linalg.solve(S, F_b @ Hb[..., None])
+            out[block] = Hb - (FH.transpose(0, 2, 1) @ z)[..., 0]
+        else:
+            WF_b = F_b if w_b is None else w_b[..., None] * F_b
+            A = F_bt @ WF_b + base
+            b = F_bt @ t_b[..., None]
+            out[block] = np.linalg.solve(A, b)[..., 0]
+
+
+def _solve_rows_cg(indptr, indices, targets, F, out, lam, rows, n_steps, weights, gram):
+    # Matrix-free CG warm-started from out[block]: A_r p = F_r.T W_r (F_r p) + lam * p
+    # (+ gram p) is applied as two batched mat-vecs, so no per-row k × k
+    # system is ever formed; a shared `gram` is applied once per block.
+    blocks = _padded_blocks(indptr, indices, F, rows, _CG_BLOCK_ROWS, targets, weights)
+    for block, F_b, (t_b, w_b) in blocks:
+        def matvec(P):
+            z = F_b @ P[..., None]                      # B × width × 1
+            if w_b is not None:
+                z *= w_b[..., None]
+            AP = (z.transpose(0, 2, 1) @ F_b)[:, 0] + lam * P
+            if gram is not None:
+                AP += P @ gram
+            return AP
+
+        x = out[block]
+        r = (t_b[:, None, :] @ F_b)[:, 0] - matvec(x)
+        p = r.copy()
+        rs = np.einsum("bk,bk->b", r, r)
+        for _ in range(n_steps):
+            Ap = matvec(p)
+            pAp = np.einsum("bk,bk->b", p, Ap)
+            alpha = np.divide(rs, pAp, out=np.zeros_like(rs), where=pAp > 0)
+            x += alpha[:, None] * p
+            r -= alpha[:, None] * Ap
+            rs_new = np.einsum("bk,bk->b", r, r)
+            beta = np.divide(rs_new, rs, out=np.zeros_like(rs), where=rs > 0)
+            p = r + beta[:, None] * p
+            rs = rs_new
+        out[block] = x
+
+
+def _solve_rows(indptr, indices, targets, F, out, lam, solver="loop", rows=None, cg_steps=CG_STEPS, weights=None, gram=None):
+    """
+    Ridge solve for every non-empty CSR row r:
+      out[r] = (gram + F[idx].T @ diag(w) @ F[idx] + diag(lam))^-1 F[idx].T @ targets[start:end]
+
+    `lam` is a scalar or a length-k vector of per-column ridge penalties.
+    `targets` and `weights` hold one value per stored entry (same layout as
+    the CSR data array); weights=None means w = 1 and gram=None means no
+    shared term. Empty rows keep their current value in `out`. The "cg"
+    solver runs `cg_steps` conjugate-gradient steps from the current `out`
+    instead of solving exactly.
+    """
+    if rows is None:
+        rows = np.arange(indptr.size - 1)
+    if np.ndim(lam):
+        lam = np.asarray(lam, dtype=F.dtype)
+    k = F.shape[1]
+    base = lam * np.eye(k, dtype=F.dtype) if np.ndim(lam) == 0 else np.diag(lam).astype(F.dtype)
+    if gram is not None:
+        base = gram + base
+    if solver == "loop":
+        _solve_rows_loop(indptr, indices, targets, F, out, base, rows, weights)
+    elif solver == "batched":
+        dual = None
+        if gram is None and weights is None and np.ndim(lam) == 0:
+            dual = "ridge"
+        elif np.all(np.asarray(lam) > 0) and (weights is None or np.all(weights > 0)):
+            # Woodbury needs an invertible base: every ridge term positive
+            dual = np.linalg.inv(base)
+        _solve_rows_batched(indptr, indices, targets, F, out, base, rows, weights, dual)
+    elif solver == "cg":
+        _solve_rows_cg(indptr, indices, targets, F, out, lam, rows, cg_steps, weights, gram)
+    else:
+        raise ValueError(f"unknown solver {solver!r}, expected one of {SOLVERS}")
+
+
+_SHARED = {}   # worker-side views of a _SharedRowSolver's arrays, by name
+
+
+def _attach_shared(specs):
+    _SHARED.clear()
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _SHARED[name] = (shm, np.ndarray(shape, dtype, buffer=shm.buf))
+
+
+def _call_shared(func, task):
+    func({name: view for name, (_, view) in _SHARED.items()}, *task)
+
+
+def _solve_shard(lo, hi, csr, targets, F, out, lam, solver, cg_steps, weights, gram):
+    a = {name: view for name, (_, view) in _SHARED.items()}
+    _solve_rows(a[csr + "_indptr"], a[csr + "_indices"], a[targets], a[F], a[out], lam, solver,
+                rows=np.arange(lo, hi), cg_steps=cg_steps,
+                weights=None if weights is None else a[weights], gram=gram)
+
+
+class _RowSolver:
+    """
+    Named arrays plus `solve`, which runs _solve_rows for one half-step, and
+    `starmap`, which runs any other kernel over the arrays (src.sgd uses it
+    for its independent SGD blocks).
 
-def train_simple_explicit_als(R, k=20, lam=0.1, n_iter=10, seed=0, init_X=None, init_Y=None):
+    CSR matrices are registered as "<name>_indptr" / "<name>_indices" and
+    every other argument of `solve` is an array name, so the serial and the
+    multi-process engines are driven by the same trainer code.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = dict(arrays)
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def solve(self, csr, targets, F, out, lam, solver, cg_steps, weights=None, gram=None):
+        a = self.arrays
+        _solve_rows(a[csr + "_indptr"], a[csr + "_indices"], a[targets], a[F], a[out], lam, solver,
+                    cg_steps=cg_steps, weights=None if weights is None else a[weights], gram=gram)
+
+    def starmap(self, func, tasks):
+        # func(arrays, *task) for every task; tasks must write disjoint slices
+        for task in tasks:
+            func(self.arrays, *task)
+
+    def close(self):
+        pass
+
+
+class _SharedRowSolver(_RowSolver):
+    """
+    _RowSolver backed by multiprocessing.shared_memory and a process pool.
+
+    Each half-step shards the rows into n_jobs contiguous ranges of roughly
+    equal nnz; workers read the CSR, target and factor arrays from shared
+    memory and write their rows of `out` in place, so only the shard bounds,
+    array names and scalars (plus the k × k gram) are pickled per call.
+    """
+
+    def __init__(self, arrays, n_jobs):
+        self.n_jobs = n_jobs
+        self._shms = []
+        self.arrays = {}
+        specs = {}
+        for name, a in arrays.items():
+            a = np.ascontiguousarray(a)
+            shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+            view = np.ndarray(a.shape, a.dtype, buffer=shm.buf)
+            view[...] = a
+            self._shms.append(shm)
+            self.arrays[name] = view
+            specs[name] = (shm.name, a.shape, a.dtype.str)
+        self._pool = get_context().Pool(n_jobs, initializer=_attach_shared, initargs=(specs,))
+
+    def solve(self, csr, targets, F, out, lam, solver, cg_steps, weights=None, gram=None):
+        indptr = self.arrays[csr + "_indptr"]
+        cuts = np.searchsorted(indptr, np.linspace(0, indptr[-1], self.n_jobs + 1)[1:-1])
+        bounds = np.unique(np.concatenate(([0], cuts, [indptr.size - 1])))
+        tasks = [(lo, hi, csr, targets, F, out, lam, solver, cg_steps, weights, gram)
+                 for lo, hi in zip(bounds[:-1], bounds[1:])]
+        self._pool.starmap(_solve_shard, tasks)
+
+    def starmap(self, func, tasks):
+        # `func` must be a module-level function so it can be pickled
+        self._pool.starmap(_call_shared, [(func, task) for task in tasks])
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+        self.arrays.clear()
+        for shm in self._shms:
+            try:
+                shm.close()
+            except BufferError:                         # a caller still holds a view
+                pass
+            shm.unlink()
+        self._shms = []
+
+
+def _row_solver(arrays, n_jobs):
+    if n_jobs is None or n_jobs == 1:
+        return _RowSolver(arrays)
+    if n_jobs < 0:
+        n_jobs = os.cpu_count() + 1 + n_jobs
+    return _SharedRowSolver(arrays, n_jobs)
+
+
+def _row_ids(indptr):
+    return np.repeat(np.arange(indptr.size - 1), np.diff(indptr))
+
+
+def _row_sums(indptr, values):
+    # per-row sums of a per-nnz array; rows without entries sum to 0
+    out = np.zeros(indptr.size - 1, dtype=values.dtype)
+    nonempty = np.flatnonzero(np.diff(indptr))
+    if nonempty.size:
+        out[nonempty] = np.add.reduceat(values, indptr[nonempty])
+    return out
+
+
+def _transpose_order(R):
+    # positions p such that R.T.tocsr().data == R.data[p]
+    order = csr_matrix((np.arange(1, R.nnz + 1), R.indices, R.indptr), shape=R.shape)
+    return order.T.tocsr().data - 1
+
+
+def _squared_error(R, R_rows, X, Y, offset=0.0):
+    pred = offset + np.einsum("nk,nk->n", X[R_rows], Y[R.indices])
+    return np.square(R.data - pred).sum()
+
+
+def _implicit_error(R, R_rows, X, Y, alpha):
+    # sum_ui c_ui (p_ui - s_ui)^2 with s = X @ Y.T, without forming s densely:
+    # sum_ui s_ui^2 = <X.T X, Y.T Y>, plus a correction on the stored entries
+    s = np.einsum("nk,nk->n", X[R_rows], Y[R.indices])
+    c = 1 + alpha * R.data
+    return np.sum((X.T @ X) * (Y.T @ Y)) + np.sum(c * (1 - s) ** 2 - s ** 2)
+
+
+def _report(callback, iteration, t0, loss, model):
+    # build the per-iteration record passed to a trainer's `callback`; a truthy
+    # return value from the callback stops training
+    info = {"iteration": iteration, "seconds": time.perf_counter() - t0, "loss": loss, "model": model}
+    return bool(callback(info))
+
+
+def train_simple_explicit_als(R, k=20, lam=0.1, n_iter=10, seed=0, init_X=None, init_Y=None, solver="loop", cg_steps=CG_STEPS, n_jobs=1, callback=None, dtype=np.float64):
+    """
+    Explicit ALS, r_ui ~ X[u] @ Y[i]. `callback` and `dtype` work as in
+    train_simple_explicit_biased_als, with (X, Y) as the model.
+    """
     m, n = R.shape
     rng = np.random.default_rng(seed)
-    X = init_X if init_X is not None else 0.01 * rng.standard_normal((m, k))
-    Y = init_Y if init_Y is not None else 0.01 * rng.standard_normal((n, k))
+    X = np.asarray(init_X, dtype) if init_X is not None else (0.01 * rng.standard_normal((m, k))).astype(dtype)
+    Y = np.asarray(init_Y, dtype) if init_Y is not None else (0.01 * rng.standard_normal((n, k))).astype(dtype)
 
     Rt = R.T.tocsr()
 
-    I_k = np.eye(k)
-
-    for _ in range(n_iter):
-        # user update
-        for u in range(m):
-            idx = R.indices[R.indptr[u]:R.indptr[u+1]]
-            if idx.size == 0:
-                continue
-            Y_u = Y[idx]
-            A = Y_u.T @ Y_u + lam * I_k
-            b = Y_u.T @ R.data[R.indptr[u]:R.indptr[u+1]]
-            X[u] = np.linalg.solve(A, b)
-
-        # item update
-        for i in range(n):
-            idx = Rt.indices[Rt.indptr[i]:Rt.indptr[i+1]]
-            if idx.size == 0:
-                continue
-            X_i = X[idx]
-            A = X_i.T @ X_i + lam * I_k
-            b = X_i.T @ Rt.data[Rt.indptr[i]:Rt.indptr[i+1]]
-            Y[i] = np.linalg.solve(A, b)
+    engine = _row_solver({
+        "R_indptr": R.indptr, "R_indices": R.indices, "r_u": R.data.astype(dtype, copy=False),
+        "Rt_indptr": Rt.indptr, "Rt_indices": Rt.indices, "r_i": Rt.data.astype(dtype, copy=False),
+        "X": X, "Y": Y,
+    }, n_jobs)
+    R_rows = _row_ids(R.indptr) if callback is not None else None
+    try:
+        for it in range(n_iter):
+            t0 = time.perf_counter()
+            # user update
+            engine.solve("R", "r_u", "Y", "X", lam, solver, cg_steps)
+
+            # item update
+            engine.solve("Rt", "r_i", "X", "Y", lam, solver, cg_steps)
+
+            if callback is not None:
+                X_it, Y_it = engine["X"], engine["Y"]
+                loss = _squared_error(R, R_rows, X_it, Y_it) + lam * (np.square(X_it).sum() + np.square(Y_it).sum())
+                stop = _report(callback, it, t0, loss, (X_it, Y_it))
+                del X_it, Y_it
+                if stop:
+                    break
+
+        if engine["X"] is not X:
+            X, Y = engine["X"].copy(), engine["Y"].copy()
+    finally:
+        engine.close()
 
     return X, Y
 
-def train_simple_explicit_biased_als(R, k=20, lam=0.1, lam_bias=0.01, n_iter=10, seed=0, init_X=None, init_Y=None, init_bu=None, init_bi=None):
+def _stream_blocks(csr, block_nnz):
+    # yield (lo, hi, local_indptr, indices, data) for consecutive row blocks of
+    # a memory-mapped CSR, each holding at most `block_nnz` entries (or one row
+    # if a single row is larger); only the current block is read into memory
+    indptr, indices, data, (n_rows, _) = csr
+    lo = 0
+    while lo < n_rows:
+        start = int(indptr[lo])
+        hi = int(np.searchsorted(indptr, start + block_nnz, side="right")) - 1
+        hi = min(max(hi, lo + 1), n_rows)
+        end = int(indptr[hi])
+        yield (lo, hi, np.asarray(indptr[lo:hi+1]) - start,
+               np.asarray(indices[start:end]), np.asarray(data[start:end]))
+        lo = hi
+
+
+def train_explicit_als_ooc(user_path, item_path, k=20, lam=0.1, n_iter=10, seed=0, init_X=None, init_Y=None, solver="loop", cg_steps=CG_STEPS, block_nnz=1 << 22, callback=None, dtype=np.float64):
+    """
+    Out-of-core explicit ALS. `user_path` and `item_path` are directories
+    written by save_csr_npy / transpose_csr_npy holding R and R.T; they are
+    memory-mapped and streamed in row blocks of at most `block_nnz` ratings,
+    so only X, Y and one block are resident at a time. Gives the same factors
+    as train_simple_explicit_als for the same seed and solver.
+    """
+    R_u = load_csr_npy(user_path)
+    R_i = load_csr_npy(item_path)
+    m, n = R_u[3]
+    if R_i[3] != (n, m):
+        raise ValueError(f"item-major shape {R_i[3]} does not match user-major shape {(m, n)}")
+    rng = np.random.default_rng(seed)
+    X = np.asarray(init_X, dtype) if init_X is not None else (0.01 * rng.standard_normal((m, k))).astype(dtype)
+    Y = np.asarray(init_Y, dtype) if init_Y is not None else (0.01 * rng.standard_normal((n, k))).astype(dtype)
+
+    for it in range(n_iter):
+        t0 = time.perf_counter()
+        # user update, then item update; out[lo:hi] is a view so each block
+        # writes straight into the factor matrix
+        for csr, F, out in ((R_u, Y, X), (R_i, X, Y)):
+            for lo, hi, indptr, indices, data in _stream_blocks(csr, block_nnz):
+                _solve_rows(indptr, indices, data.astype(dtype, copy=False), F, out[lo:hi], lam, solver, cg_steps=cg_steps)
+
+        if callback is not None:
+            loss = lam * (np.square(X).sum() + np.square(Y).sum())
+            for lo, hi, indptr, indices, data in _stream_blocks(R_u, block_nnz):
+                rows = lo + _row_ids(indptr)
+                loss += np.square(data - np.einsum("nk,nk->n", X[rows], Y[indices])).sum()
+            if _report(callback, it, t0, loss, (X, Y)):
+                break
+
+    return X, Y
+
+
+def update_explicit_als(R, R_delta, X, Y, lam=0.1, n_sweeps=2, neighbours=False, seed=0, solver="loop", cg_steps=CG_STEPS):
+    """
+    Refresh a model from train_simple_explicit_als after a batch of new ratings
+    by re-solving only the users and items the batch touches.
+
+    Parameters
+    ----------
+    R          : csr_matrix the model (X, Y) was trained on
+    R_delta    : csr_matrix of new or changed ratings; its stored entries
+                 overwrite those of R (a stored 0 removes the rating). It may
+                 have more rows/columns than R for new users/items, whose
+                 factors start from the same small random init as training.
+    X, Y       : current factors, updated in place when the shape is unchanged
+    n_sweeps   : user + item re-solves over the touched rows
+    neighbours : also re-solve the one-hop neighbourhood, i.e. every user who
+                 rated a touched item and every item rated by a touched user
+
+    Returns
+    -------
+    X, Y, R_new, info where R_new is the merged rating matrix and info holds
+    the number of users and items that were re-solved.
+    """
+    m = max(R.shape[0], R_delta.shape[0])
+    n = max(R.shape[1], R_delta.shape[1])
+    R, R_delta = R.copy(), R_delta.tocsr()
+    R.resize((m, n))
+    R_delta.resize((m, n))
+    pattern = R_delta.copy()
+    pattern.data[:] = 1
+    R_new = (R - R.multiply(pattern) + R_delta).tocsr()
+    R_new.sort_indices()
+    Rc = R_new.tocsc()                                  # item-major view of R_new
+    Rc.sort_indices()
+
+    rng = np.random.default_rng(seed)
+    k = X.shape[1]
+    if X.shape[0] < m:
+        X = np.vstack([X, 0.01 * rng.standard_normal((m - X.shape[0], k))]).astype(X.dtype)
+    if Y.shape[0] < n:
+        Y = np.vstack([Y, 0.01 * rng.standard_normal((n - Y.shape[0], k))]).astype(Y.dtype)
+
+    delta = R_delta.tocoo()
+    users, items = np.unique(delta.row), np.unique(delta.col)
+    if neighbours:
+        users, items = (
+            np.union1d(users, np.unique(Rc[:, items].tocoo().row)),
+            np.union1d(items, np.unique(R_new[users].indices)),
+        )
+
+    r_u, r_i = R_new.data.astype(X.dtype, copy=False), Rc.data.astype(X.dtype, copy=False)
+    for _ in range(n_sweeps):
+        _solve_rows(R_new.indptr, R_new.indices, r_u, Y, X, lam, solver, rows=users, cg_steps=cg_steps)
+        _solve_rows(Rc.indptr, Rc.indices, r_i, X, Y, lam, solver, rows=items, cg_steps=cg_steps)
+
+    info = {"users": int(users.size), "items": int(items.size)}
+    return X, Y, R_new, info
+
+
+def train_simple_explicit_biased_als(R, k=20, lam=0.1, lam_bias=0.01, n_iter=10, seed=0, init_X=None, init_Y=None, init_bu=None, init_bi=None, solver="loop", cg_steps=CG_STEPS, n_jobs=1, bias_mode="alternating", callback=None, dtype=np.float64):
+    """
+    Explicit ALS with global mean and user/item biases:
+      r_ui ~ mu + bu[u] + bi[i] + X[u] @ Y[i]
+
+    bias_mode="alternating" updates bu, bi and then X, Y in four phases per
+    iteration (the bias phases are segmented sums over the CSR rows).
+    bias_mode="augmented" folds the biases into the factors, solving for
+    [X[u], bu[u]] against [Y[i], 1] and for [Y[i], bi[i]] against [X[u], 1]
+    with lam on the factor columns and lam_bias on the bias column.
+
+    `callback`, if given, is called after every iteration with a dict of
+    iteration, seconds, loss (regularized training objective) and model
+    (mu, bu, bi, X, Y as live arrays; copy them to keep a snapshot). Training
+    stops early when it returns a truthy value; see ALSMonitor.
+
+    `dtype` (np.float64 or np.float32) sets the precision of the factors,
+    biases and every solve; float32 halves memory and speeds up BLAS.
+    """
+    if bias_mode not in ("alternating", "augmented"):
+        raise ValueError(f"unknown bias_mode {bias_mode!r}")
     m, n = R.shape
     rng = np.random.default_rng(seed)
 
-    mu = R.data.mean()
-    X = init_X if init_X is not None else 0.01 * rng.standard_normal((m, k))
-    Y = init_Y if init_Y is not None else 0.01 * rng.standard_normal((n, k))
-    bu = init_bu if init_bu is not None else np.zeros(m)
-    bi = init_bi if init_bi is not None else np.zeros(n)
+    data = R.data.astype(dtype, copy=False)
+    mu = data.mean()
+    X = np.asarray(init_X, dtype) if init_X is not None else (0.01 * rng.standard_normal((m, k))).astype(dtype)
+    Y = np.asarray(init_Y, dtype) if init_Y is not None else (0.01 * rng.standard_normal((n, k))).astype(dtype)
+    bu = np.asarray(init_bu, dtype) if init_bu is not None else np.zeros(m, dtype)
+    bi = np.asarray(init_bi, dtype) if init_bi is not None else np.zeros(n, dtype)
+
+    if bias_mode == "augmented":
+        return _train_augmented_biased_als(R, mu, X, Y, bu, bi, lam, lam_bias, n_iter, solver, cg_steps, n_jobs, callback)
+
+    Rt = R.T.tocsr()
+    R_rows = _row_ids(R.indptr)
+    Rt_rows = _row_ids(Rt.indptr)
+    to_item_major = _transpose_order(R)
+    data_t = Rt.data.astype(dtype, copy=False)
+    n_u = (np.diff(R.indptr) + lam_bias).astype(dtype)
+    n_i = (np.diff(Rt.indptr) + lam_bias).astype(dtype)
+    has_u = np.diff(R.indptr) > 0
+    has_i = np.diff(Rt.indptr) > 0
+
+    engine = _row_solver({
+        "R_indptr": R.indptr, "R_indices": R.indices, "r_hat_u": np.empty(R.nnz, dtype),
+        "Rt_indptr": Rt.indptr, "Rt_indices": Rt.indices, "r_hat_i": np.empty(Rt.nnz, dtype),
+        "X": X, "Y": Y,
+    }, n_jobs)
+    X_out, Y_out = X, Y
+    X, Y = engine["X"], engine["Y"]
+    try:
+        for it in range(n_iter):
+            t0 = time.perf_counter()
+            # X[u] @ Y[i] for every rating, shared by both bias phases
+            dots = np.einsum("nk,nk->n", X[R_rows], Y[R.indices])
+
+            # ---------- (1) update user-biases ----------
+            resid = data - mu - bi[R.indices] - dots
+            bu[has_u] = _row_sums(R.indptr, resid)[has_u] / n_u[has_u]
+
+            # ---------- (2) update item-biases ----------
+            resid = data_t - mu - bu[Rt.indices] - dots[to_item_major]
+            bi[has_i] = _row_sums(Rt.indptr, resid)[has_i] / n_i[has_i]
+
+            # ---------- (3) update user factors ----------
+            engine["r_hat_u"][:] = data - mu - bu[R_rows] - bi[R.indices]
+            engine.solve("R", "r_hat_u", "Y", "X", lam, solver, cg_steps)
+
+            # ---------- (4) update item factors ----------
+            engine["r_hat_i"][:] = data_t - mu - bu[Rt.indices] - bi[Rt_rows]
+            engine.solve("Rt", "r_hat_i", "X", "Y", lam, solver, cg_steps)
+
+            if callback is not None:
+                loss = (_squared_error(R, R_rows, X, Y, mu + bu[R_rows] + bi[R.indices])
+                        + lam * (np.square(X).sum() + np.square(Y).sum())
+                        + lam_bias * (np.square(bu).sum() + np.square(bi).sum()))
+                if _report(callback, it, t0, loss, (mu, bu, bi, X, Y)):
+                    break
+
+        if X is not X_out:
+            X_out, Y_out = X.copy(), Y.copy()
+        del X, Y
+    finally:
+        engine.close()
+
+    return mu, bu, bi, X_out, Y_out
+
+
+def _train_augmented_biased_als(R, mu, X, Y, bu, bi, lam, lam_bias, n_iter, solver, cg_steps, n_jobs, callback):
+    # XA = [X | bu] and YA = [Y | bi]. Before a user solve the bias column of
+    # YA is swapped for ones (so it acts as the intercept feature for bu) and
+    # bi moves into the targets; the item solve does the same with XA.
+    k = X.shape[1]
+    Rt = R.T.tocsr()
+    R_rows = _row_ids(R.indptr)
+    lam_vec = np.append(np.full(k, lam, dtype=float), lam_bias)
+    dtype = X.dtype
+    data, data_t = R.data.astype(dtype, copy=False), Rt.data.astype(dtype, copy=False)
+
+    engine = _row_solver({
+        "R_indptr": R.indptr, "R_indices": R.indices, "r_hat_u": np.empty(R.nnz, dtype),
+        "Rt_indptr": Rt.indptr, "Rt_indices": Rt.indices, "r_hat_i": np.empty(Rt.nnz, dtype),
+        "XA": np.column_stack([X, bu]), "YA": np.column_stack([Y, bi]),
+    }, n_jobs)
+    try:
+        XA, YA = engine["XA"], engine["YA"]
+        for it in range(n_iter):
+            t0 = time.perf_counter()
+            # ---------- user factors + user-biases ----------
+            bi = YA[:, k].copy()
+            YA[:, k] = 1.0
+            engine["r_hat_u"][:] = data - mu - bi[R.indices]
+            engine.solve("R", "r_hat_u", "YA", "XA", lam_vec, solver, cg_steps)
+            YA[:, k] = bi
+
+            # ---------- item factors + item-biases ----------
+            bu = XA[:, k].copy()
+            XA[:, k] = 1.0
+            engine["r_hat_i"][:] = data_t - mu - bu[Rt.indices]
+            engine.solve("Rt", "r_hat_i", "XA", "YA", lam_vec, solver, cg_steps)
+            XA[:, k] = bu
+
+            if callback is not None:
+                bi = YA[:, k]
+                loss = (_squared_error(R, R_rows, XA[:, :k], YA[:, :k], mu + bu[R_rows] + bi[R.indices])
+                        + lam * (np.square(XA[:, :k]).sum() + np.square(YA[:, :k]).sum())
+                        + lam_bias * (np.square(bu).sum() + np.square(bi).sum()))
+                stop = _report(callback, it, t0, loss, (mu, bu, bi, XA[:, :k], YA[:, :k]))
+                del bi
+                if stop:
+                    break
+
+        X[:], bu = XA[:, :k], XA[:, k].copy()
+        Y[:], bi = YA[:, :k], YA[:, k].copy()
+        del XA, YA
+    finally:
+        engine.close()
+
+    return mu, bu, bi, X, Y
+
+
+def train_implicit_als(R, k=20, lam=0.1, alpha=40.0, n_iter=10, seed=0, init_X=None, init_Y=None, solver="loop", cg_steps=CG_STEPS, n_jobs=1, callback=None, dtype=np.float64):
+    """
+    Implicit-feedback ALS (Hu, Koren & Volinsky, 2008).
+
+    Every stored entry r_ui of R is an observed interaction with preference
+    p_ui = 1 and confidence c_ui = 1 + alpha * r_ui; missing entries have
+    p_ui = 0 and c_ui = 1. Each user solve uses
+      (Y.T Y + Y_u.T (C_u - I) Y_u + lam I) x_u = Y_u.T c_u
+    with Y.T Y computed once per half-step, so a row costs O(nnz_u k^2)
+    rather than O(n_items k^2). Items are updated symmetrically.
+
+    Returns X, Y, usable with evaluate_XY / topk_preds like the explicit model.
+    `callback` and `dtype` work as in train_simple_explicit_biased_als, with the
+    confidence-weighted objective as the loss and (X, Y) as the model.
+    """
+    m, n = R.shape
+    rng = np.random.default_rng(seed)
+    X = np.asarray(init_X, dtype) if init_X is not None else (0.01 * rng.standard_normal((m, k))).astype(dtype)
+    Y = np.asarray(init_Y, dtype) if init_Y is not None else (0.01 * rng.standard_normal((n, k))).astype(dtype)
 
     Rt = R.T.tocsr()
-    I_k = np.eye(k)
-
-    for _ in range(n_iter):
-
-        # ---------- (1) update user-biases ----------
-        for u in range(m):
-            start, end = R.indptr[u], R.indptr[u+1]
-            if start == end:
-                continue
-            idx   = R.indices[start:end]                # items rated by u
-            r_u   = R.data[start:end]
-            resid = r_u - mu - bi[idx] - X[u] @ Y[idx].T
-            bu[u] = resid.sum() / (len(idx) + lam_bias)
-
-        # ---------- (2) update item-biases ----------
-        for i in range(n):
-            start, end = Rt.indptr[i], Rt.indptr[i+1]
-            if start == end:
-                continue
-            idx   = Rt.indices[start:end]               # users who rated i
-            r_i   = Rt.data[start:end]
-            resid = r_i - mu - bu[idx] - X[idx] @ Y[i]
-            bi[i] = resid.sum() / (len(idx) + lam_bias)
-
-        # ---------- (3) update user factors ----------
-        for u in range(m):
-            start, end = R.indptr[u], R.indptr[u+1]
-            if start == end:
-                continue
-            idx   = R.indices[start:end]
-            Y_u   = Y[idx]                              # |I_u| × k
-            r_hat = R.data[start:end] - mu - bu[u] - bi[idx]
-            A = Y_u.T @ Y_u + lam * I_k
-            b = Y_u.T @ r_hat
-            X[u] = np.linalg.solve(A, b)
-
-        # ---------- (4) update item factors ----------
-        for i in range(n):
-            start, end = Rt.indptr[i], Rt.indptr[i+1]
-            if start == end:
-                continue
-            idx   = Rt.indices[start:end]
-            X_i   = X[idx]                              # |J_i| × k
-            r_hat = Rt.data[start:end] - mu - bu[idx] - bi[i]
-            A = X_i.T @ X_i + lam * I_k
-            b = X_i.T @ r_hat
-            Y[i] = np.linalg.solve(A, b)
-
-    return mu, bu, bi, X, Y
\ No newline at end of file
+    w_u = (alpha * R.data).astype(dtype)                # c - 1 per stored entry
+    w_i = (alpha * Rt.data).astype(dtype)
+
+    engine = _row_solver({
+        "R_indptr": R.indptr, "R_indices": R.indices,
+        "Rt_indptr": Rt.indptr, "Rt_indices": Rt.indices,
+        "c_u": 1 + w_u, "w_u": w_u,
+        "c_i": 1 + w_i, "w_i": w_i,
+        "X": X, "Y": Y,
+    }, n_jobs)
+    R_rows = _row_ids(R.indptr) if callback is not None else None
+    try:
+        for it in range(n_iter):
+            t0 = time.perf_counter()
+            # user update
+            engine.solve("R", "c_u", "Y", "X", lam, solver, cg_steps,
+                         weights="w_u", gram=engine["Y"].T @ engine["Y"])
+
+            # item update
+            engine.solve("Rt", "c_i", "X", "Y", lam, solver, cg_steps,
+                         weights="w_i", gram=engine["X"].T @ engine["X"])
+
+            if callback is not None:
+                X_it, Y_it = engine["X"], engine["Y"]
+                loss = _implicit_error(R, R_rows, X_it, Y_it, alpha) + lam * (np.square(X_it).sum() + np.square(Y_it).sum())
+                stop = _report(callback, it, t0, loss, (X_it, Y_it))
+                del X_it, Y_it
+                if stop:
+                    break
+
+        if engine["X"] is not X:
+            X, Y = engine["X"].copy(), engine["Y"].copy()
+    finally:
+        engine.close()
+
+    return X, Y
+
+
+class ALSMonitor:
+    """
+    Callback for the ALS trainers that records a per-iteration history and
+    stops training once the monitored quantity has converged.
+
+    Parameters
+    ----------
+    R_train   : csr_matrix used for training; needed (with R_val) for val_ndcg,
+                where it masks already-seen items
+    R_val     : csr_matrix of held-out ratings; enables val_rmse (and val_ndcg)
+    k         : cut-off for val_ndcg
+    n_users   : validation metrics are computed on a fixed random sample of
+                this many users with held-out ratings
+    monitor   : "loss", "val_rmse" or "val_ndcg"
+    tol       : minimum relative improvement that counts as progress
+    patience  : stop after this many iterations in a row without progress
+    """
+
+    def __init__(self, R_train=None, R_val=None, k=10, n_users=1000, monitor="loss", tol=1e-4, patience=2, seed=0):
+        if monitor not in ("loss", "val_rmse", "val_ndcg"):
+            raise ValueError(f"unknown monitor {monitor!r}")
+        if monitor != "loss" and R_val is None:
+            raise ValueError(f"monitor={monitor!r} needs R_val")
+        if monitor == "val_ndcg" and R_train is None:
+            raise ValueError("monitor='val_ndcg' needs R_train")
+        self.R_train, self.R_val = R_train, R_val
+        self.k, self.monitor, self.tol, self.patience = k, monitor, tol, patience
+        self.history = []
+        self.best = None
+        self._stale = 0
+        self._users = None
+        if R_val is not None:
+            candidates = np.flatnonzero(np.diff(R_val.tocsr().indptr))
+            rng = np.random.default_rng(seed)
+            self._users = np.sort(rng.choice(candidates, min(n_users, candidates.size), replace=False))
+
+    def _validate(self, model):
+        if len(model) == 5:
+            mu, bu, bi, X, Y = model
+            biased = dict(biased=True, mu=mu, bu=bu[self._users], bi=bi)
+        else:
+            X, Y = model
+            biased = {}
+        users = self._users
+        R_val = self.R_val[users]
+        metrics = {"val_rmse": rmse_XY(R_val, X[users], Y, **biased)}
+        if self.R_train is not None:
+            ranking = evaluate_XY(self.R_train[users], R_val, X[users], Y, k=self.k, **biased)
+            metrics["val_ndcg"] = float(ranking["ndcg"])
+        return metrics
+
+    def __call__(self, info):
+        record = {key: info[key] for key in ("iteration", "seconds", "loss")}
+        if self._users is not None:
+            record.update(self._validate(info["model"]))
+        self.history.append(record)
+
+        value = record[self.monitor]
+        higher_is_better = self.monitor == "val_ndcg"
+        margin = self.tol * abs(self.best) if self.best is not None else 0.0
+        if self.best is None or (value > self.best + margin if higher_is_better else value < self.best - margin):
+            self.best = value
+            self._stale = 0
+        else:
+            self._stale += 1
+        return self._stale >= self.patience
@@ -1,7 +1,7 @@
 import numpy as np
 import pandas as pd
 from src.utils.similarities import cosine_similarity
-from scipy.sparse import csr_matrix
+from scipy.sparse import csr_matrix, diags
 
 def compute_user_profiles(R, items, item_cols):
     B = (R >= 4).astype(int)
@@ -38,18 +38,156 @@ def get_genre_matrix(item_meta_df: pd.DataFrame, genre_cols:list) -> csr_matrix:
     mat = df[genre_cols].values.astype(float)
     return csr_matrix(mat)
 
-def compute_content_scores(R: csr_matrix, genre_matrix: csr_matrix) -> np.ndarray:
+def compute_content_scores(R: csr_matrix, genre_matrix: csr_matrix, dtype=None) -> np.ndarray:
     """
     Build user profiles by averaging binary genre vectors for items each user has rated,
     then compute content similarity scores: user_profiles @ genre_matrix.T
 
     Returns
     -------
-    content_scores : dense array of shape (n_users, n_items)
+    content_scores : dense array of shape (n_users, n_items), in `dtype` if given
     """
     ratings = R.toarray()    # shape (n_users, n_items)
+    if dtype is not None:
+        ratings = ratings.astype(dtype, copy=False)
+        genre_matrix = genre_matrix.astype(dtype)
     weights = ratings / ratings.sum(axis=1, keepdims=True)  # normalize ratings
     weights[np.isnan(weights)] = 0
     user_profiles = weights @ genre_matrix
     content_scores = user_profiles @ genre_matrix.T
-    return content_scores
\ No newline at end of file
+    return content_scores
+
+
+class GenreSignatureIndex:
+    """
+    Items grouped by identical genre vector ("signature"). MovieLens has a
+    few hundred distinct signatures for ~1.7k items, so users are scored
+    once per signature instead of once per item, and top-k expands the
+    best signatures' item groups in order, skipping seen items.
+
+    Parameters
+    ----------
+    genre_matrix : (n_items, n_genres) csr_matrix or array, see get_genre_matrix
+    dtype        : dtype of the signatures (default float64)
+    """
+
+    def __init__(self, genre_matrix, dtype=np.float64):
+        G = genre_matrix.toarray() if hasattr(genre_matrix, "toarray") else np.asarray(genre_matrix)
+        signatures, group_of = np.unique(G, axis=0, return_inverse=True)
+        self.signatures = signatures.astype(dtype)
+        self.group_of = group_of.ravel()
+        # item ids grouped by signature, ascending within each group
+        self.members = np.argsort(self.group_of, kind="stable")
+        self.group_sizes = np.bincount(self.group_of, minlength=len(signatures))
+        self.group_starts = np.concatenate(([0], np.cumsum(self.group_sizes)))
+        # (n_items, n_signatures) one-hot, to count seen items per signature
+        self.group_onehot = csr_matrix((np.ones(self.group_of.size, dtype=np.int64), (np.arange(self.group_of.size), self.group_of)),
+                                       shape=(self.group_of.size, len(signatures)))
+
+    def score_users(self, profiles: np.ndarray) -> np.ndarray:
+        """Scores of every signature, shape (n_users, n_signatures)."""
+        return profiles @ self.signatures.T
+
+    def topk(self, profiles: np.ndarray, seen: csr_matrix, k: int = 10) -> np.ndarray:
+        """
+        Top-k items for every row of `profiles`, skipping the stored entries of
+        the matching row of `seen`. Items of equal score come signature by
+        signature, lower item id first. Rows with fewer than k unseen items
+        are padded with -1.
+        """
+        scores = self.score_users(profiles)
+        n_rows, n_items = scores.shape[0], self.group_of.size
+        out = np.full((n_rows, k), -1, dtype=np.int64)
+        if k == 0 or not scores.size:
+            return out
+        seen = csr_matrix(seen)
+        seen_keys = np.sort(np.repeat(np.arange(n_rows), np.diff(seen.indptr)) * n_items + seen.indices)
+        pattern = csr_matrix((np.ones(seen.nnz, dtype=np.int64), seen.indices, seen.indptr), shape=(n_rows, n_items))
+        seen_per_group = (pattern @ self.group_onehot).toarray()
+
+        # only the signatures scoring at least the one that completes k
+        # unseen items are expanded, and of each only its first k + seen
+        # members, which hold its first k unseen items
+        cutoff = _count_cutoffs(scores, self.group_sizes - seen_per_group, k)
+        rows, groups = np.nonzero(scores >= cutoff[:, None])
+        lengths = np.minimum(self.group_sizes[groups], k + seen_per_group[rows, groups])
+        pos = np.repeat(self.group_starts[groups] - (lengths.cumsum() - lengths), lengths) + np.arange(lengths.sum())
+        rows, groups, items = np.repeat(rows, lengths), np.repeat(groups, lengths), self.members[pos]
+        if seen_keys.size:
+            keys = rows * n_items + items
+            unseen = seen_keys[np.minimum(np.searchsorted(seen_keys, keys), seen_keys.size - 1)] != keys
+            rows, groups, items = rows[unseen], groups[unseen], items[unseen]
+
+        # rank every row's candidates and keep the first k
+        ranked = np.lexsort((items, groups, -scores[rows, groups], rows))
+        rows, items = rows[ranked], items[ranked]
+        rank = np.arange(rows.size) - np.searchsorted(rows, rows)
+        out[rows[rank < k], rank[rank < k]] = items[rank < k]
+        return out
+
+
+def _count_cutoffs(scores, counts, k):
+    # per row of scores, the highest score t such that the columns scoring
+    # at least t have counts summing to k or more (the lowest score if they
+    # never do). Most rows reach k within their best 2k columns; the others
+    # are sorted in full.
+    cutoff = np.empty(scores.shape[0])
+    rows = np.arange(scores.shape[0])
+    width = min(scores.shape[1], 2 * k)
+    best = np.argpartition(-scores, width - 1, axis=1)[:, :width]
+    while True:
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        ranked = np.argsort(-best_scores, axis=1)
+        best, best_scores = np.take_along_axis(best, ranked, axis=1), np.take_along_axis(best_scores, ranked, axis=1)
+        total = np.cumsum(np.take_along_axis(counts, best, axis=1), axis=1)
+        done = (total[:, -1] >= k) | (best.shape[1] == scores.shape[1])
+        last = np.minimum((total < k).sum(axis=1), best.shape[1] - 1)
+        cutoff[rows[done]] = best_scores[done, last[done]]
+        rows, scores, counts = rows[~done], scores[~done], counts[~done]
+        if not rows.size:
+            return cutoff
+        best = np.argsort(-scores, axis=1)
+
+
+class ContentScorer:
+    """
+    compute_content_scores in factored form. Keeps the rating-weighted genre
+    profiles (n_users x n_genres) and the genre matrix (n_items x n_genres)
+    and computes profiles[users] @ genre_matrix.T only for the users asked
+    for, so memory is O((n_users + n_items) * n_genres) instead of
+    O(n_users * n_items).
+
+    Parameters
+    ----------
+    R            : csr_matrix of training ratings; its stored entries are the
+                   seen items that topk skips
+    genre_matrix : csr_matrix of shape (n_items, n_genres), see get_genre_matrix
+    dtype        : dtype of the profiles and scores (default float64)
+    """
+
+    def __init__(self, R: csr_matrix, genre_matrix: csr_matrix, dtype=np.float64):
+        self.R = csr_matrix(R)
+        sums = np.asarray(self.R.sum(axis=1), dtype=float).ravel()
+        # sparse row normalization; users without ratings get a zero profile
+        inv = np.divide(1.0, sums, out=np.zeros_like(sums), where=sums != 0)
+        weights = diags(inv) @ self.R
+        self.profiles = np.asarray((weights @ genre_matrix).todense(), dtype=dtype)
+        self.genres = np.asarray(genre_matrix.todense(), dtype=dtype)
+        self.index = GenreSignatureIndex(genre_matrix, dtype=dtype)
+
+    def score_users(self, user_ids) -> np.ndarray:
+        """Content scores of the given users, shape (len(user_ids), n_items)."""
+        return self.profiles[user_ids] @ self.genres.T
+
+    def topk(self, k: int = 10, user_ids=None, block_users: int = 1024) -> np.ndarray:
+        """
+        Top-k unseen items for `user_ids` (default all users), best first,
+        `block_users` users at a time through the genre-signature index.
+        Returns (n, k) item indices.
+        """
+        user_ids = np.arange(self.R.shape[0]) if user_ids is None else np.asarray(user_ids)
+        out = np.empty((user_ids.size, k), dtype=np.int64)
+        for lo in range(0, user_ids.size, block_users):
+            block = user_ids[lo:lo+block_users]
+            out[lo:lo+block.size] = self.index.topk(self.profiles[block], self.R[block], k)
+        return out
@@ -2,21 +2,25 @@ import numpy as np
 from scipy.sparse import csr_matrix
 import pandas as pd
 
-from src.content_based_baseline import compute_content_scores, get_genre_matrix
-from src.metrics.evaluate import _ground_truth
-from src.metrics.metrics import hr_at_k, item_coverage, ndcg_at_k, precision_at_k, recall_at_k, user_coverage
+from src.content_based_baseline import ContentScorer, get_genre_matrix
+from src.metrics.metrics import ranking_metrics
 
 def compute_cf_scores(mu: float,
                       bu: np.ndarray,
                       bi: np.ndarray,
                       X: np.ndarray,
-                      Y: np.ndarray) -> np.ndarray:
+                      Y: np.ndarray,
+                      dtype=None) -> np.ndarray:
     """
     Compute collaborative-filtering score matrix as:
       mu + bu u + bi i + X[u] @ Y[i].T
 
-    Returns dense array of shape (n_users, n_items).
+    Returns dense array of shape (n_users, n_items), in `dtype` if given
+    (e.g. np.float32 to halve its memory) or else in the factors' dtype.
     """
+    if dtype is not None:
+        X, Y = X.astype(dtype, copy=False), Y.astype(dtype, copy=False)
+        bu, bi, mu = bu.astype(dtype, copy=False), bi.astype(dtype, copy=False), np.dtype(dtype).type(mu)
     scores = X @ Y.T
     scores = mu + bu[:, None] + bi[None, :] + scores
     return scores
@@ -45,6 +49,53 @@ def topk_hybrid(R_train: csr_matrix,
     ])
     return topk_sorted
 
+def _score_blocks(R_train, mu, bu, bi, X, Y, content, block_users):
+    # (users, cf scores, content scores, seen (rows, cols) with R_train > 0)
+    # for consecutive blocks of users
+    R_train = csr_matrix(R_train)
+    for lo in range(0, R_train.shape[0], block_users):
+        users = np.arange(lo, min(lo + block_users, R_train.shape[0]))
+        cf = mu + bu[users, None] + bi[None, :] + X[users] @ Y.T
+        seen = R_train[users]
+        rows = np.repeat(np.arange(users.size), np.diff(seen.indptr))
+        positive = seen.data > 0
+        yield users, cf, content.score_users(users), (rows[positive], seen.indices[positive])
+
+def _masked_topk(scores, seen, k):
+    # top-k columns of every row of scores, best first, skipping seen
+    # (overwrites scores)
+    scores[seen] = -np.inf
+    topk = np.argpartition(-scores, k, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, topk, axis=1), axis=1)
+    return np.take_along_axis(topk, order, axis=1)
+
+def stream_topk_hybrid(R_train: csr_matrix,
+                       mu: float,
+                       bu: np.ndarray,
+                       bi: np.ndarray,
+                       X: np.ndarray,
+                       Y: np.ndarray,
+                       content: ContentScorer,
+                       alpha: float,
+                       k: int,
+                       block_users: int = 1024,
+                       dtype=None):
+    """
+    topk_hybrid without the dense (n_users, n_items) matrices. Users are taken
+    `block_users` at a time; for each block the CF scores (as in
+    compute_cf_scores) and the content scores (content.score_users) are
+    computed on the fly, blended, seen items (R_train > 0) masked from the
+    CSR indices, and the top-k picked with argpartition.
+
+    Yields (user_ids, topk) per block, topk of shape (len(user_ids), k), so
+    peak memory is bounded by the block size, not by the catalog.
+    """
+    if dtype is not None:
+        X, Y = X.astype(dtype, copy=False), Y.astype(dtype, copy=False)
+        bu, bi, mu = bu.astype(dtype, copy=False), bi.astype(dtype, copy=False), np.dtype(dtype).type(mu)
+    for users, cf, content_scores, seen in _score_blocks(R_train, mu, bu, bi, X, Y, content, block_users):
+        yield users, _masked_topk(alpha * cf + (1 - alpha) * content_scores, seen, k)
+
 def evaluate_hybrid(R_train: csr_matrix,
                     R_test: csr_matrix,
                     mu: float,
@@ -55,7 +106,9 @@ def evaluate_hybrid(R_train: csr_matrix,
                     item_meta_df: pd.DataFrame,
                     genre_cols: list,
                     alpha: float = 0.5,
-                    k: int = 10) -> dict:
+                    k: int = 10,
+                    dtype=None,
+                    block_users: int = 1024) -> dict:
     """
     End-to-end evaluation for hybrid CF + genre-content model.
 
@@ -69,6 +122,9 @@ def evaluate_hybrid(R_train: csr_matrix,
     genre_cols    : list of column names for binary genre features
     alpha         : weight for CF vs content (0=content only,1=CF only)
     k             : number of recommendations per user
+    dtype         : dtype of the scores (e.g. np.float32); None keeps the
+                    factors' dtype for CF and float64 for content
+    block_users   : users scored per block (see stream_topk_hybrid)
 
     Returns
     -------
@@ -77,23 +133,50 @@ def evaluate_hybrid(R_train: csr_matrix,
     # 1) build genre matrix
     genre_matrix = get_genre_matrix(item_meta_df, genre_cols)
 
-    # 2) compute score matrices
-    cf_scores = compute_cf_scores(mu, bu, bi, X, Y)
-    content_scores = compute_content_scores(R_train, genre_matrix)
-
-    # 3) hybrid top-k predictions
-    preds = topk_hybrid(R_train, cf_scores, content_scores, alpha, k)
-
-    # 4) ground truth for test
-    truth = _ground_truth(R_test)
-    n_items = Y.shape[0]
-
-    # 5) compute metrics
-    return {
-        "hr":            hr_at_k(preds, truth, k),
-        "precision":     precision_at_k(preds, truth, k),
-        "recall":        recall_at_k(preds, truth, k),
-        "ndcg":          ndcg_at_k(preds, truth, k),
-        "user_coverage": user_coverage(preds),
-        "item_coverage": item_coverage(preds, n_items),
-    }
+    # 2) content scores in factored form
+    content = ContentScorer(R_train, genre_matrix, dtype=dtype or np.float64)
+
+    # 3) hybrid top-k predictions, one block of users at a time
+    preds = np.vstack([topk for _, topk in stream_topk_hybrid(R_train, mu, bu, bi, X, Y, content, alpha, k,
+                                                               block_users=block_users, dtype=dtype)])
+
+    # 4) metrics against the test matrix
+    return ranking_metrics(preds, R_test, k, Y.shape[0])
+
+def sweep_hybrid(R_train: csr_matrix,
+                 R_test: csr_matrix,
+                 mu: float,
+                 bu: np.ndarray,
+                 bi: np.ndarray,
+                 X: np.ndarray,
+                 Y: np.ndarray,
+                 item_meta_df: pd.DataFrame,
+                 genre_cols: list,
+                 alphas,
+                 ks=(10,),
+                 dtype=None,
+                 block_users: int = 1024) -> pd.DataFrame:
+    """
+    evaluate_hybrid for every alpha in `alphas` and every k in `ks`, in one
+    pass. The genre matrix and, per block of users, the CF and content
+    scores are computed once and reused by every blend; each blend keeps its
+    top max(ks) items, cut to each k afterwards.
+
+    Returns a DataFrame with one row per (alpha, k) and the columns of
+    evaluate_hybrid's metrics dict.
+    """
+    if dtype is not None:
+        X, Y = X.astype(dtype, copy=False), Y.astype(dtype, copy=False)
+        bu, bi, mu = bu.astype(dtype, copy=False), bi.astype(dtype, copy=False), np.dtype(dtype).type(mu)
+    genre_matrix = get_genre_matrix(item_meta_df, genre_cols)
+    content = ContentScorer(R_train, genre_matrix, dtype=dtype or np.float64)
+    max_k = max(ks)
+
+    preds = {alpha: np.empty((R_train.shape[0], max_k), dtype=np.int64) for alpha in alphas}
+    for users, cf, content_scores, seen in _score_blocks(R_train, mu, bu, bi, X, Y, content, block_users):
+        for alpha in alphas:
+            preds[alpha][users] = _masked_topk(alpha * cf + (1 - alpha) * content_scores, seen, max_k)
+
+    rows = [{"alpha": alpha, "k": k, **ranking_metrics(preds[alpha][:, :k], R_test, k, Y.shape[0])}
+            for alpha in alphas for k in ks]
+    return pd.DataFrame(rows)
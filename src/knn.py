@@ -1,10 +1,238 @@
 import numpy as np
+from scipy import sparse
 
-from src.utils.similarities import cosine_similarity
+from src.utils.kernels import top_k_average
+from src.utils.similarities import (PAIRWISE, _as_csr, _llr_values, _prepare_similarity_row, _similarity_block, _similarity_row, _top_n_candidates, _top_n_entries, adjusted_cosine_similarity,
+                                   cosine_similarity, jaccard_similarity, log_likelihood_similarity, pairwise_similarity,
+                                   pearson_similarity, tanimoto_similarity, top_n_similarities)
+
+def _neighbour_graph(X, similarity_func, n_neighbors, index, max_memory):
+    # top-N neighbour CSR over the rows of X: exact over all pairs (tiled,
+    # within max_memory), or over the candidate pairs of an approximate
+    # `index`. The candidates come sorted by row, so they are scored a block
+    # of rows at a time from the prepared similarity state (up to six moment
+    # rows and as many temporaries per row), and every row's top N is final
+    # once its block is done.
+    if index is None:
+        return top_n_similarities(X, similarity_func=similarity_func, n_neighbors=n_neighbors, max_memory=max_memory)
+    X = _as_csr(X)
+    n = X.shape[0]
+    rows, cols = index.fit(X).candidate_pairs()
+    prepared = _prepare_similarity_row(X, similarity_func)
+    bounds = np.searchsorted(rows, np.arange(n + 1))
+    step = max(1, max_memory // (8 * 12 * max(n, X.shape[1], 1)))
+    data, top_rows, top_cols = [], [], []
+    for lo in range(0, n, step):
+        r, c = rows[bounds[lo]:bounds[min(lo + step, n)]], cols[bounds[lo]:bounds[min(lo + step, n)]]
+        if not r.size:
+            continue
+        top_sims, (top_r, top_c) = _top_n_candidates(prepared, r, c, n_neighbors)
+        data.append(top_sims)
+        top_rows.append(top_r)
+        top_cols.append(top_c)
+    if not data:
+        return sparse.csr_matrix((n, n))
+    top = sparse.csr_matrix((np.concatenate(data), (np.concatenate(top_rows), np.concatenate(top_cols))), shape=(n, n))
+    top.sort_indices()
+    return top
+
+def fit_user_knn(ratings_matrix, similarity_func=cosine_similarity, n_neighbors=50, index=None, max_memory=1 << 28):
+    """
+    Precompute the user-user neighbour graph for knn_predict_user.
+
+    Similarities are computed tile by tile with sparse products and every
+    row keeps its `n_neighbors` most similar other users with positive
+    similarity (see src.utils.similarities.top_n_similarities), so memory
+    stays around `max_memory` bytes plus the output.
+    Returns an (n_users, n_users) CSR matrix; pass it as `neighbours=`.
+
+    `index` (e.g. src.utils.lsh.HyperplaneLSH) makes the fit approximate:
+    only the candidate pairs it proposes are scored.
+    """
+    return _neighbour_graph(ratings_matrix, similarity_func, n_neighbors, index, max_memory)
+
+ITEM_SIMILARITIES = (cosine_similarity, adjusted_cosine_similarity, pearson_similarity)
+
+def fit_item_knn(ratings_matrix, similarity_func=cosine_similarity, n_neighbors=50, index=None, max_memory=1 << 28):
+    """
+    Precompute the item-item neighbour index for knn_predict_item and
+    recommend_item_knn: for every item, its `n_neighbors` most similar other
+    items (positive similarity only) under cosine, adjusted cosine or Pearson
+    over the users who rated both.
+
+    Returns an (n_items, n_items) CSR matrix with int32 indices and float32
+    weights. It is cheap to keep around; save_csr_npy / load_csr_npy store it.
+    `index` and `max_memory` work as in fit_user_knn.
+    """
+    if similarity_func not in ITEM_SIMILARITIES:
+        raise ValueError(f"item KNN supports {[f.__name__ for f in ITEM_SIMILARITIES]}")
+    items_users = ratings_matrix.T.tocsr() if sparse.issparse(ratings_matrix) else np.asarray(ratings_matrix, dtype=float).T
+    top = _neighbour_graph(items_users, similarity_func, n_neighbors, index, max_memory)
+    return sparse.csr_matrix((top.data.astype(np.float32), top.indices.astype(np.int32), top.indptr.astype(np.int32)),
+                             shape=top.shape)
+
+RELATED_SIMILARITIES = (jaccard_similarity, log_likelihood_similarity, tanimoto_similarity)
+
+def fit_related_items(interactions, similarity_func=log_likelihood_similarity, n_neighbors=20, block_items=1024):
+    """
+    "People who liked X also liked" table: for every item, the `n_neighbors`
+    items that co-occur with it most strongly, under Jaccard, log-likelihood
+    ratio or Tanimoto on the binarized interaction matrix. Every stored entry
+    of a sparse `interactions` counts as 1 and missing ones as 0; in a dense
+    array the positive entries count as 1 and zeros and NaN as 0.
+
+    All co-occurrence counts come from B.T @ B, a block of `block_items`
+    items at a time; with k11 the co-occurrences of items i and j and n_i,
+    n_j their totals over n_users:
+      jaccard = tanimoto = k11 / (n_i + n_j - k11)
+      llr from the 2x2 table k11, n_i - k11, n_j - k11, n_users - n_i - n_j + k11
+    Only pairs that co-occur at least once are scored. Returns an
+    (n_items, n_items) CSR matrix like fit_item_knn, usable with
+    recommend_item_knn.
+    """
+    if similarity_func not in RELATED_SIMILARITIES:
+        raise ValueError(f"related items support {[f.__name__ for f in RELATED_SIMILARITIES]}")
+    if sparse.issparse(interactions):
+        B = _as_csr(interactions)
+        B.data[:] = 1
+    else:
+        B = sparse.csr_matrix((np.asarray(interactions, dtype=float) > 0).astype(float))
+    n_users, n_items = B.shape
+    Bt = B.T.tocsr()
+    totals = np.diff(Bt.indptr).astype(float)
+    data, rows, cols = [], [], []
+    for lo in range(0, n_items, block_items):
+        C = (Bt[lo:lo+block_items] @ B).tocoo()
+        i, j, k11 = C.row + lo, C.col, C.data
+        n_i, n_j = totals[i], totals[j]
+        if similarity_func is log_likelihood_similarity:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                sims = _llr_values(None, k11, n_i - k11, n_j - k11, n_users - n_i - n_j + k11)
+        else:
+            sims = k11 / (n_i + n_j - k11)
+        top_sims, (top_i, top_j) = _top_n_entries(i, j, sims, n_neighbors)
+        data.append(top_sims)
+        rows.append(top_i)
+        cols.append(top_j)
+    top = sparse.csr_matrix((np.concatenate(data).astype(np.float32), (np.concatenate(rows), np.concatenate(cols))),
+                            shape=(n_items, n_items))
+    top.sort_indices()
+    return sparse.csr_matrix((top.data, top.indices.astype(np.int32), top.indptr.astype(np.int32)), shape=top.shape)
+
+def recommend_item_knn(R_train, neighbours, k=10, block_users=1024):
+    """
+    Top-k unseen items for every user from an item neighbour index:
+      score(u, j) = sum over the neighbours i of j of sim(j, i) * R_train[u, i]
+    i.e. R_train @ neighbours.T, computed `block_users` rows at a time.
+    Returns an (n_users, k) array of item indices, best first.
+    """
+    R_train = sparse.csr_matrix(R_train)
+    St = neighbours.T.tocsr()
+    out = np.empty((R_train.shape[0], k), dtype=np.int64)
+    for lo in range(0, R_train.shape[0], block_users):
+        block = R_train[lo:lo+block_users]
+        scores = (block @ St).toarray()
+        rows = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+        scores[rows, block.indices] = -np.inf
+        top = np.argpartition(-scores, k, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+        out[lo:lo+block.shape[0]] = np.take_along_axis(top, order, axis=1)
+    return out
+
+def _predict_from_neighbours(nbrs, sims, ratings, k):
+    # weighted average over the k most similar neighbours that have a rating
+    # (neighbour similarities are positive)
+    rated = ~np.isnan(ratings)
+    return top_k_average(nbrs[rated], sims[rated], ratings[rated], k)
+
+def _stored(R, rows):
+    # dense copy of the given rows of the CSR matrix R, NaN where no rating
+    # is stored
+    rows = np.asarray(rows)
+    starts, ends = R.indptr[rows], R.indptr[rows + 1]
+    lengths = ends - starts
+    pos = np.repeat(ends - lengths.cumsum(), lengths) + np.arange(lengths.sum())
+    out = np.full((rows.size, R.shape[1]), np.nan)
+    out[np.repeat(np.arange(rows.size), lengths), R.indices[pos]] = R.data[pos]
+    return out
+
+class RatingsIndex:
+    """
+    A ratings matrix prepared for repeated knn_predict_user / knn_predict_item
+    calls: the user-major CSR matrix R and its item-major transpose Rt are
+    built once, so a prediction only reads the rows it needs instead of
+    copying and scanning the whole matrix. The similarity preparation
+    (centering, transpose) is done on the first call with each similarity
+    function and kept. Pass it in place of ratings_matrix; `.T` is the same
+    index with users and items swapped.
+    """
+
+    def __init__(self, ratings_matrix):
+        self.R = _as_csr(ratings_matrix)
+        self.Rt = self.R.T.tocsr()
+        self._T = None
+        self._prepared = {}
+
+    @property
+    def T(self):
+        if self._T is None:
+            self._T = RatingsIndex.__new__(RatingsIndex)
+            self._T.R, self._T.Rt, self._T._T, self._T._prepared = self.Rt, self.R, self, {}
+        return self._T
+
+    def _prepare(self, similarity_func):
+        if similarity_func not in self._prepared:
+            self._prepared[similarity_func] = _prepare_similarity_row(self.R, similarity_func)
+        return self._prepared[similarity_func]
+
+    def similarity_row(self, row, similarity_func):
+        """Similarities of `row` to every row of R under similarity_func."""
+        return _similarity_row(self._prepare(similarity_func), row)
+
+    def similarity_rows(self, rows, similarity_func):
+        """similarity_row for several rows, shape (len(rows), n_rows)."""
+        return _similarity_block(self._prepare(similarity_func), rows)
+
+def _ratings_index(ratings_matrix):
+    if isinstance(ratings_matrix, RatingsIndex):
+        return ratings_matrix
+    return RatingsIndex(ratings_matrix)
+
+def _predict_sparse(index, row, col, k, similarity_func, neighbours):
+    # knn_predict_user on a RatingsIndex: the other rows that rated `col`
+    # (row `col` of the transpose), weighted by their similarity to `row`
+    lo, hi = index.Rt.indptr[col], index.Rt.indptr[col + 1]
+    others, ratings = index.Rt.indices[lo:hi], index.Rt.data[lo:hi]
+    if neighbours is not None:
+        sims = _stored(neighbours, [row])[0]
+    else:
+        sims = index.similarity_row(row, similarity_func)
+    keep = (others != row) & (np.nan_to_num(sims[others]) > 0)
+    return _predict_from_neighbours(others[keep], sims[others[keep]], ratings[keep], k)
 
 def knn_predict_user(
-    ratings_matrix, user_id, item_id, k=5, similarity_func=cosine_similarity
+    ratings_matrix, user_id, item_id, k=5, similarity_func=cosine_similarity, neighbours=None
 ):
+    """
+    `neighbours`, the output of fit_user_knn, replaces the similarity scan
+    over all users with a lookup of the user's precomputed neighbours.
+
+    ratings_matrix may also be a CSR matrix whose stored entries are the
+    ratings (e.g. from load_split), or a RatingsIndex over one; memory then
+    stays O(nnz). The similarity row of the user is computed through the
+    RatingsIndex: co-rated moments from src.utils.kernels for cosine,
+    Pearson, Euclidean, adjusted cosine and Tanimoto, the pairwise versions
+    in src.utils.similarities for the other measures. A CSR matrix is
+    indexed on every call; for many predictions build a RatingsIndex once
+    and pass that instead.
+    """
+    if sparse.issparse(ratings_matrix) or isinstance(ratings_matrix, RatingsIndex):
+        return _predict_sparse(_ratings_index(ratings_matrix), user_id, item_id, k, similarity_func, neighbours)
+    if neighbours is not None:
+        start, end = neighbours.indptr[user_id], neighbours.indptr[user_id + 1]
+        nbrs, sims = neighbours.indices[start:end], neighbours.data[start:end]
+        return _predict_from_neighbours(nbrs, sims, ratings_matrix[nbrs, item_id], k)
+
     target_ratings = ratings_matrix[user_id]
     sims = []
     for other_user in range(ratings_matrix.shape[0]):
@@ -25,8 +253,20 @@ def knn_predict_user(
     return prediction
 
 def knn_predict_item(
-    ratings_matrix, user_id, item_id, k=5, similarity_func=cosine_similarity
+    ratings_matrix, user_id, item_id, k=5, similarity_func=cosine_similarity, neighbours=None
 ):
+    """
+    `neighbours`, the output of fit_item_knn, replaces the similarity scan
+    over all items with a lookup of the item's precomputed neighbours.
+    ratings_matrix may be CSR or a RatingsIndex, as in knn_predict_user.
+    """
+    if sparse.issparse(ratings_matrix) or isinstance(ratings_matrix, RatingsIndex):
+        return _predict_sparse(_ratings_index(ratings_matrix).T, item_id, user_id, k, similarity_func, neighbours)
+    if neighbours is not None:
+        start, end = neighbours.indptr[item_id], neighbours.indptr[item_id + 1]
+        nbrs, sims = neighbours.indices[start:end], neighbours.data[start:end]
+        return _predict_from_neighbours(nbrs, sims, ratings_matrix[user_id, nbrs], k)
+
     target_ratings = ratings_matrix[:, item_id]
     sims = []
     for other_item in range(ratings_matrix.shape[1]):
@@ -43,4 +283,78 @@ def knn_predict_item(
         return np.nan
     sims_arr, ratings_arr = zip(*top_k)
     prediction = np.average(ratings_arr, weights=np.abs(sims_arr))
-    return prediction
\ No newline at end of file
+    return prediction
+
+def _similarity_rows(index, targets, similarity_func, neighbours, block_rows=256):
+    # (len(targets), n_rows) similarities of the target rows of the
+    # RatingsIndex against all rows
+    if neighbours is not None:
+        return neighbours[targets].toarray()
+    if similarity_func in PAIRWISE:
+        return index.similarity_rows(targets, similarity_func)
+    # no pairwise version: call it on dense rows, a block of others at a time
+    R = index.R
+    dense_targets = _stored(R, targets)
+    sims = np.empty((len(targets), R.shape[0]))
+    for lo in range(0, R.shape[0], block_rows):
+        others = _stored(R, np.arange(lo, min(lo + block_rows, R.shape[0])))
+        sims[:, lo:lo+len(others)] = [[similarity_func(t, o) for o in others] for t in dense_targets]
+    return sims
+
+def knn_predict_user_batch(
+    ratings_matrix, user_ids, item_ids, k=5, similarity_func=cosine_similarity, neighbours=None, block_users=256
+):
+    """
+    knn_predict_user for arrays of (user, item) pairs; returns an array of
+    predictions (NaN where no neighbour qualifies). ratings_matrix is a dense
+    array with NaN for missing ratings, a CSR matrix of stored ratings or a
+    RatingsIndex; either way it is worked on as CSR, so memory stays O(nnz) plus one
+    block of similarity rows.
+
+    Pairs are grouped by user so each similarity row is computed (or fetched
+    from `neighbours`) once, `block_users` users at a time. The raters of
+    every pair's item are then gathered for the whole block at once and
+    ranked by similarity, like the single-pair predictor does per call.
+    """
+    index = _ratings_index(ratings_matrix)
+    Rt = index.Rt
+    user_ids, item_ids = np.asarray(user_ids), np.asarray(item_ids)
+    preds = np.full(user_ids.size, np.nan)
+    order = np.argsort(user_ids, kind="stable")
+    users, starts = np.unique(user_ids[order], return_index=True)
+    ends = np.append(starts[1:], order.size)
+
+    for b in range(0, users.size, block_users):
+        block = users[b:b+block_users]
+        sims = _similarity_rows(index, block, similarity_func, neighbours)
+        # the pairs of the block and the row of sims each belongs to
+        pairs = order[starts[b]:ends[b + block.size - 1]]
+        slot = np.repeat(np.arange(block.size), ends[b:b+block.size] - starts[b:b+block.size])
+        # every (pair, other row that rated the pair's item)
+        lo, hi = Rt.indptr[item_ids[pairs]], Rt.indptr[item_ids[pairs] + 1]
+        lengths = hi - lo
+        pos = np.repeat(hi - lengths.cumsum(), lengths) + np.arange(lengths.sum())
+        which = np.repeat(np.arange(pairs.size), lengths)
+        others, ratings = Rt.indices[pos], Rt.data[pos]
+        w = sims[slot[which], others]
+        keep = (others != block[slot[which]]) & (w > 0)
+        which, others, ratings, w = which[keep], others[keep], ratings[keep], w[keep]
+        # the k most similar of every pair, ties to the lower index
+        ranked = np.lexsort((others, -w, which))
+        which, ratings, w = which[ranked], ratings[ranked], w[ranked]
+        top = np.arange(which.size) - np.searchsorted(which, which) < k
+        den = np.bincount(which[top], weights=w[top], minlength=pairs.size)
+        num = np.bincount(which[top], weights=w[top] * ratings[top], minlength=pairs.size)
+        ok = den > 0
+        preds[pairs[ok]] = num[ok] / den[ok]
+    return preds
+
+def knn_predict_item_batch(
+    ratings_matrix, user_ids, item_ids, k=5, similarity_func=cosine_similarity, neighbours=None, block_items=256
+):
+    """
+    knn_predict_item for arrays of (user, item) pairs, grouped by item. Item
+    KNN on R is user KNN on R.T with the roles of users and items swapped.
+    """
+    return knn_predict_user_batch(_ratings_index(ratings_matrix).T, item_ids, user_ids, k=k,
+                                  similarity_func=similarity_func, neighbours=neighbours, block_users=block_items)
@@ -3,10 +3,13 @@ from scipy.sparse import csr_matrix
 from sklearn.metrics import mean_squared_error, mean_absolute_error
 import math
 
-from src.metrics.metrics import hr_at_k, item_coverage, ndcg_at_k, precision_at_k, recall_at_k, user_coverage
+from src.content_based_baseline import GenreSignatureIndex
+from src.metrics.metrics import hr_at_k, item_coverage, ndcg_at_k, precision_at_k, ranking_metrics, recall_at_k, user_coverage
 
 
-def topk_preds(R_train, X, Y, k):
+def topk_preds(R_train, X, Y, k, dtype=None):
+    if dtype is not None:
+        X, Y = X.astype(dtype, copy=False), Y.astype(dtype, copy=False)
     m, n = R_train.shape
     Yt = Y.T
     preds = []
@@ -29,8 +32,12 @@ def topk_preds_biased(R_train: csr_matrix,
                      bi: np.ndarray,
                      X: np.ndarray,
                      Y: np.ndarray,
-                     k: int):
+                     k: int,
+                     dtype=None):
 
+    if dtype is not None:
+        X, Y = X.astype(dtype, copy=False), Y.astype(dtype, copy=False)
+        bu, bi, mu = bu.astype(dtype, copy=False), bi.astype(dtype, copy=False), np.dtype(dtype).type(mu)
     m, n = R_train.shape
     scores = X @ Y.T
     scores = mu + bu[:, None] + bi[None, :] + scores
@@ -61,22 +68,20 @@ def evaluate(predicted, ground_truth, k, n_items):
         "item_coverage":   item_coverage(predicted, n_items),
     }
 
-def evaluate_XY(R_train, R_test, X, Y, k=10, biased=False, bu=None, bi=None, mu=0.0):
+def evaluate_XY(R_train, R_test, X, Y, k=10, biased=False, bu=None, bi=None, mu=0.0, dtype=None):
     if biased:
-        preds = topk_preds_biased(R_train, mu, bu, bi, X, Y, k)
+        preds = topk_preds_biased(R_train, mu, bu, bi, X, Y, k, dtype=dtype)
     else:
-        preds = topk_preds(R_train, X, Y, k)
-    truth = _ground_truth(R_test)
-    n_items = Y.shape[0]
+        preds = topk_preds(R_train, X, Y, k, dtype=dtype)
+    return ranking_metrics(np.asarray(preds), R_test, k, Y.shape[0])
 
-    return {
-        "hr":            hr_at_k(preds, truth, k),
-        "precision":     precision_at_k(preds, truth, k),
-        "recall":        recall_at_k(preds, truth, k),
-        "ndcg":          ndcg_at_k(preds, truth, k),
-        "user_coverage": user_coverage(preds),
-        "item_coverage": item_coverage(preds, n_items),
-    }
+
+def rmse_XY(R_test, X, Y, biased=False, bu=None, bi=None, mu=0.0):
+    coo = R_test.tocoo()
+    pred = np.sum(X[coo.row] * Y[coo.col], axis=1)
+    if biased:
+        pred += mu + bu[coo.row] + bi[coo.col]
+    return float(np.sqrt(mean_squared_error(coo.data, pred)))
 
 
 def evaluate_content_all_metrics(user_profiles, R_test, items, item_cols, k=10, rating_min=1, rating_max=5):
@@ -92,14 +97,15 @@ def evaluate_content_all_metrics(user_profiles, R_test, items, item_cols, k=10,
     item_norms[item_norms == 0] = 1
     X_norm = X / item_norms
 
-    # 3) predicted rating matrix
-    sim = P_norm.dot(X_norm.T)  # in [-1,1]
+    # 3) predicted ratings, scored once per distinct genre signature
+    index = GenreSignatureIndex(X_norm)
+    sim = index.score_users(P_norm)  # in [-1,1], shape (n_users, n_signatures)
     preds = (sim + 1) / 2 * (rating_max - rating_min) + rating_min
 
     # 4) rating metrics
     u_idx, i_idx = R_test.nonzero()
     y_true = R_test.data
-    y_pred = preds[u_idx, i_idx]
+    y_pred = preds[u_idx, index.group_of[i_idx]]
     rmse = np.sqrt(mean_squared_error(y_true, y_pred))
     mae = mean_absolute_error(y_true, y_pred)
 
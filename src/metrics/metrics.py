@@ -58,4 +58,50 @@ def item_coverage(predicted, n_items):
     all_recs = set()
     for p in predicted:
         all_recs.update(i for i in p if not np.isnan(i))
-    return len(all_recs) / n_items if n_items > 0 else 0.0
\ No newline at end of file
+    return len(all_recs) / n_items if n_items > 0 else 0.0
+
+def ranking_metrics(predicted, truth, k, n_items):
+    """
+    hr_at_k, precision_at_k, recall_at_k, ndcg_at_k, user_coverage and
+    item_coverage in one vectorized pass, for predictions given as an
+    (n_users, >= k) int array (one row per user, no repeated items in a row)
+    and the ground truth as a CSR matrix whose stored entries of row u are
+    user u's relevant items (e.g. R_test).
+
+    Hits come from one membership test: every (user, item) prediction is
+    looked up by binary search among the sorted (row, column) keys of the
+    truth matrix. All metrics are then read off the shared hit matrix.
+    Per-user terms are summed left to right like the loops above, so the
+    results are the same.
+    """
+    n_users = len(predicted)
+    if n_users == 0:
+        return {"hr": 0.0, "precision": 0.0, "recall": 0.0, "ndcg": 0.0, "user_coverage": 0.0, "item_coverage": 0.0}
+    predicted = np.asarray(predicted, dtype=np.int64).reshape(n_users, -1)
+    truth = truth.tocsr(copy=True)
+    truth.sum_duplicates()
+    top = predicted[:, :k]
+    width = truth.shape[1]
+
+    keys = np.repeat(np.arange(truth.shape[0], dtype=np.int64), np.diff(truth.indptr)) * width + truth.indices
+    query = np.arange(n_users, dtype=np.int64)[:, None] * width + top
+    pos = np.minimum(np.searchsorted(keys, query), max(keys.size - 1, 0))
+    hits = (top >= 0) & (top < width) & (keys[pos] == query) if keys.size else np.zeros(top.shape, dtype=bool)
+
+    n_hits = hits.sum(axis=1)
+    n_relevant = np.diff(truth.indptr)[:n_users]
+
+    discounts = 1 / np.log2(np.arange(top.shape[1]) + 2)
+    dcg = np.cumsum(np.where(hits, discounts, 0.0), axis=1)[:, -1] if top.shape[1] else np.zeros(n_users)
+    ideal = np.concatenate(([0.0], np.cumsum(discounts)))[n_hits]
+    ndcg = np.divide(dcg, ideal, out=np.zeros(n_users), where=ideal > 0)
+    recall = np.divide(n_hits, n_relevant, out=np.zeros(n_users), where=n_relevant > 0)
+
+    return {
+        "hr":            int((n_hits > 0).sum()) / n_users,
+        "precision":     int(n_hits.sum()) / (n_users * k),
+        "recall":        float(np.cumsum(recall)[-1] / n_users),
+        "ndcg":          float(np.cumsum(ndcg)[-1] / n_users),
+        "user_coverage": (n_users if predicted.shape[1] else 0) / n_users,
+        "item_coverage": np.unique(predicted).size / n_items if n_items > 0 else 0.0,
+    }
@@ -0,0 +1,215 @@
+import numpy as np
+from scipy import sparse
+
+# k-means distance cells (points x centers) computed at a time
+_KMEANS_CELLS = 1 << 22
+
+
+def _kmeans(points, n_clusters, n_iter, rng):
+    # Lloyd's k-means from random points; returns (labels, centers). The
+    # distances are taken a chunk of points at a time, and |p|^2 is left out
+    # since it does not change a point's nearest center.
+    n = points.shape[0]
+    centers = points[rng.choice(n, n_clusters, replace=False)]
+    labels = np.empty(n, dtype=np.int64)
+    step = max(1, _KMEANS_CELLS // n_clusters)
+    for _ in range(n_iter + 1):
+        center_sq = np.einsum("ij,ij->i", centers, centers)
+        for lo in range(0, n, step):
+            labels[lo:lo+step] = np.argmin(center_sq - 2 * points[lo:lo+step] @ centers.T, axis=1)
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = sparse.csr_matrix((np.ones(n), (labels, np.arange(n))), shape=(n_clusters, n)) @ points
+        # empty clusters keep their old center
+        centers = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+    return labels, centers
+
+
+class MIPSIndex:
+    """
+    Maximum-inner-product top-k index for serving ALS factors, built once per
+    model. Scores are the trainers' predictions
+        mu + bu[u] + bi[i] + X[u] @ Y[i]
+    The item bias is folded into the item vectors, y' = [Y[i], bi[i]] with
+    query q = [X[u], 1], and the user terms do not change the ranking.
+
+    The items are split into `n_buckets` equal-size buckets by the norm of
+    y', and each bucket into k-means clusters (`n_clusters` in all). Each
+    cluster keeps its centroid c, radius r = max |y' - c| and largest norm m,
+    so every item in it scores at most min(q @ c + |q| r, |q| m). The norm
+    buckets keep m close to the norms of the whole cluster, so clusters of
+    small vectors are skipped early. recommend visits clusters in decreasing
+    bound order and skips those whose bound is below the current k-th score,
+    which gives the exact top-k without scanning the whole catalog.
+    With `n_probe` it visits only that many clusters (approximate, faster).
+    recommend_batch serves many users at once.
+
+    Parameters
+    ----------
+    X, Y       : user and item factors
+    bu, bi, mu : biases of the biased trainers (None / 0 for unbiased models)
+    n_clusters : number of item clusters (default ~ sqrt(n_items))
+    n_buckets  : number of norm buckets (default n_clusters // 8)
+    n_iter     : k-means iterations
+    """
+
+    def __init__(self, X, Y, bu=None, bi=None, mu=0.0, n_clusters=None, n_buckets=None, n_iter=10, seed=0):
+        n_items = Y.shape[0]
+        self.X = X
+        self.user_offset = mu + (bu if bu is not None else np.zeros(X.shape[0]))
+        self.items = np.hstack([Y, (bi if bi is not None else np.zeros(n_items))[:, None]])
+        n_clusters = min(n_clusters or max(1, int(np.sqrt(n_items))), n_items)
+        n_buckets = min(n_buckets or max(1, n_clusters // 8), n_clusters)
+
+        rng = np.random.default_rng(seed)
+        norms = np.linalg.norm(self.items, axis=1)
+        bucket = np.empty(n_items, dtype=np.int64)
+        bucket[np.argsort(norms, kind="stable")] = np.arange(n_items) * n_buckets // n_items
+        labels = np.empty(n_items, dtype=np.int64)
+        centers = []
+        for b in range(n_buckets):
+            members = np.flatnonzero(bucket == b)
+            n_b = min((b + 1) * n_clusters // n_buckets - b * n_clusters // n_buckets, members.size)
+            bucket_labels, bucket_centers = _kmeans(self.items[members], n_b, n_iter, rng)
+            labels[members] = bucket_labels + sum(len(c) for c in centers)
+            centers.append(bucket_centers)
+        # drop clusters that ended up empty
+        kept, labels = np.unique(labels, return_inverse=True)
+        centers = np.vstack(centers)[kept]
+        n_clusters = kept.size
+
+        order = np.argsort(labels, kind="stable")
+        self.members = order
+        self.sorted_items = self.items[order]
+        self.position = np.empty(n_items, dtype=np.int64)
+        self.position[order] = np.arange(n_items)
+        self.starts = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=n_clusters))))
+        self.centers = centers
+        residual = np.linalg.norm(self.items - centers[labels], axis=1)
+        self.radius = np.zeros(n_clusters)
+        np.maximum.at(self.radius, labels, residual)
+        # |q| * max |y'| also bounds the cluster (Cauchy-Schwarz); the
+        # smaller of the two is used
+        self.max_norm = np.zeros(n_clusters)
+        np.maximum.at(self.max_norm, labels, norms)
+
+    def _queries(self, users):
+        return np.hstack([self.X[users], np.ones((len(users), 1))])
+
+    def _bounds(self, Q):
+        # (n_queries, n_clusters) upper bounds on the scores in each cluster
+        q_norm = np.linalg.norm(Q, axis=1)[:, None]
+        return np.minimum(Q @ self.centers.T + q_norm * self.radius, q_norm * self.max_norm)
+
+    def _positions(self, clusters):
+        # positions in sorted_items of the members of `clusters`, in order
+        sizes = self.starts[clusters + 1] - self.starts[clusters]
+        shift = np.repeat(self.starts[clusters] - (np.cumsum(sizes) - sizes), sizes)
+        return shift + np.arange(sizes.sum())
+
+    def recommend(self, user, k=10, exclude=None, n_probe=None):
+        """
+        Top-k items for `user`, best first, skipping the item ids in `exclude`
+        (e.g. R_train[user].indices). Exact unless `n_probe` limits the
+        number of clusters visited.
+
+        Returns (items, scores); scores include mu + bu[user]. The number of
+        items scored is kept in self.last_scanned.
+        """
+        q = self._queries([user])[0]
+        bounds = self._bounds(q[None])[0]
+        order = np.argsort(-bounds)
+        if n_probe is not None:
+            order = order[:n_probe]
+        excluded = None
+        if exclude is not None and len(exclude):
+            excluded = np.zeros(self.items.shape[0], dtype=bool)
+            excluded[exclude] = True
+
+        # score clusters in bound order, in chunks that double in size; once
+        # there are k candidates, skip clusters whose bound is below the k-th
+        # score (and stop when the next chunk's best bound is)
+        items, scores = np.empty(0, dtype=np.int64), np.empty(0)
+        self.last_scanned = 0
+        pos, step = 0, 4
+        while pos < order.size:
+            chunk = order[pos:pos+step]
+            pos, step = pos + step, 2 * step
+            if items.size == k:
+                chunk = chunk[bounds[chunk] >= scores.min()]
+                if not chunk.size:
+                    break
+            at = self._positions(chunk)
+            more, new_scores = self.members[at], self.sorted_items[at] @ q
+            if excluded is not None:
+                ok = ~excluded[more]
+                more, new_scores = more[ok], new_scores[ok]
+            self.last_scanned += more.size
+            items, scores = np.concatenate([items, more]), np.concatenate([scores, new_scores])
+            if items.size > k:
+                keep = np.argpartition(-scores, k)[:k]
+                items, scores = items[keep], scores[keep]
+
+        ranked = np.argsort(-scores, kind="stable")
+        return items[ranked], scores[ranked] + self.user_offset[user]
+
+    def recommend_batch(self, users, k=10, exclude=None, n_probe=None):
+        """
+        recommend for every user in `users` at once. `exclude` is a CSR
+        matrix with a row per user id (e.g. R_train); its stored items are
+        skipped.
+
+        Clusters are visited once for the whole batch, in decreasing order
+        of their mean bound, and each scores the users whose bound still
+        reaches their k-th score (and, with n_probe, that have it among
+        their n_probe best bounds) with one matrix product.
+
+        Returns (items, scores), (len(users), k) best first; rows with fewer
+        than k items are padded with -1 / -inf. self.last_scanned is the
+        number of (user, item) scores computed.
+        """
+        users = np.asarray(users)
+        n, n_clusters = users.size, self.centers.shape[0]
+        Q = self._queries(users)
+        bounds = self._bounds(Q)
+        probed = np.ones_like(bounds, dtype=bool)
+        if n_probe is not None and n_probe < n_clusters:
+            probed[:] = False
+            np.put_along_axis(probed, np.argpartition(-bounds, n_probe - 1, axis=1)[:, :n_probe], True, axis=1)
+
+        # excluded (user slot, position) pairs, sorted by position
+        if exclude is not None:
+            E = exclude[users].tocoo()
+            order = np.argsort(self.position[E.col], kind="stable")
+            ex_slot, ex_pos = E.row[order], self.position[E.col][order]
+        else:
+            ex_slot, ex_pos = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        row_of = np.full(n, -1)
+
+        best_items = np.full((n, k), -1, dtype=np.int64)
+        best_scores = np.full((n, k), -np.inf)
+        self.last_scanned = 0
+        for c in np.argsort(-bounds.mean(axis=0)):
+            active = np.flatnonzero(probed[:, c] & (bounds[:, c] >= best_scores.min(axis=1)))
+            lo, hi = self.starts[c], self.starts[c + 1]
+            if not active.size or lo == hi:
+                continue
+            block = Q[active] @ self.sorted_items[lo:hi].T
+            e_lo, e_hi = np.searchsorted(ex_pos, [lo, hi])
+            if e_hi > e_lo:
+                row_of[active] = np.arange(active.size)
+                rows = row_of[ex_slot[e_lo:e_hi]]
+                hit = rows >= 0
+                block[rows[hit], ex_pos[e_lo:e_hi][hit] - lo] = -np.inf
+                row_of[active] = -1
+            self.last_scanned += block.size
+            scores = np.hstack([best_scores[active], block])
+            items = np.hstack([best_items[active], np.broadcast_to(self.members[lo:hi], block.shape)])
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores[active] = np.take_along_axis(scores, top, axis=1)
+            best_items[active] = np.take_along_axis(items, top, axis=1)
+
+        ranked = np.argsort(-best_scores, axis=1, kind="stable")
+        best_items = np.take_along_axis(best_items, ranked, axis=1)
+        best_scores = np.take_along_axis(best_scores, ranked, axis=1)
+        best_items[np.isneginf(best_scores)] = -1
+        return best_items, best_scores + self.user_offset[users][:, None]
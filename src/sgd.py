@@ -0,0 +1,92 @@
+import time
+
+import numpy as np
+
+from src.als import _report, _row_ids, _row_solver, _squared_error
+
+
+def _sgd_block(a, block, seed, mu, lr, lam, lam_bias, batch_size):
+    # one shuffled pass over the ratings of a (user block, item block) pair.
+    # Each minibatch is a vectorized step; repeated users/items within it have
+    # their updates summed (Hogwild-style, no locking).
+    lo, hi = a["offsets"][block], a["offsets"][block + 1]
+    order = lo + np.random.default_rng(seed).permutation(hi - lo)
+    X, Y, bu, bi = a["X"], a["Y"], a["bu"], a["bi"]
+    lr = X.dtype.type(lr)
+    for s in range(0, order.size, batch_size):
+        idx = order[s:s+batch_size]
+        u, i = a["rows"][idx], a["cols"][idx]
+        xu, yi = X[u], Y[i]
+        err = a["vals"][idx] - mu - bu[u] - bi[i] - np.einsum("nk,nk->n", xu, yi)
+        np.add.at(bu, u, lr * (err - lam_bias * bu[u]))
+        np.add.at(bi, i, lr * (err - lam_bias * bi[i]))
+        np.add.at(X, u, lr * (err[:, None] * yi - lam * xu))
+        np.add.at(Y, i, lr * (err[:, None] * xu - lam * yi))
+
+
+def train_sgd_biased_mf(R, k=20, lr=0.01, lam=0.02, lam_bias=0.01, n_epochs=20, seed=0, init_X=None, init_Y=None, init_bu=None, init_bi=None, batch_size=256, n_strata=None, n_jobs=1, callback=None, dtype=np.float64):
+    """
+    Biased matrix factorization trained with SGD (DSGD-style stratified blocks):
+      r_ui ~ mu + bu[u] + bi[i] + X[u] @ Y[i]
+
+    Users and items are split into `n_strata` random blocks (default n_jobs).
+    Each epoch runs n_strata sub-epochs; in a sub-epoch the blocks (b, b + s)
+    share no users or items, so they are processed concurrently by n_jobs
+    worker processes over shared memory. Inside a block the ratings are
+    shuffled and taken in minibatches of `batch_size`.
+
+    Returns (mu, bu, bi, X, Y) like train_simple_explicit_biased_als, and takes
+    the same `callback` and `dtype`; the reported loss is the same regularized
+    objective, so the two trainers can be compared on time-to-quality. For a
+    fixed n_strata the result does not depend on n_jobs.
+    """
+    m, n = R.shape
+    rng = np.random.default_rng(seed)
+    S = n_strata or max(n_jobs if n_jobs and n_jobs > 0 else 1, 1)
+
+    R = R.tocsr()
+    R_rows = _row_ids(R.indptr)
+    data = R.data.astype(dtype, copy=False)
+    mu = data.mean()
+    X = np.asarray(init_X, dtype) if init_X is not None else (0.01 * rng.standard_normal((m, k))).astype(dtype)
+    Y = np.asarray(init_Y, dtype) if init_Y is not None else (0.01 * rng.standard_normal((n, k))).astype(dtype)
+    bu = np.asarray(init_bu, dtype) if init_bu is not None else np.zeros(m, dtype)
+    bi = np.asarray(init_bi, dtype) if init_bi is not None else np.zeros(n, dtype)
+
+    # group the ratings by (user block, item block); a random permutation
+    # modulo S gives blocks of equal size
+    user_block = rng.permutation(m) % S
+    item_block = rng.permutation(n) % S
+    key = user_block[R_rows] * S + item_block[R.indices]
+    order = np.argsort(key, kind="stable")
+    offsets = np.searchsorted(key[order], np.arange(S * S + 1))
+
+    engine = _row_solver({
+        "rows": R_rows[order], "cols": R.indices[order], "vals": data[order], "offsets": offsets,
+        "X": X, "Y": Y, "bu": bu, "bi": bi,
+    }, n_jobs)
+    X_out, Y_out, bu_out, bi_out = X, Y, bu, bi
+    X, Y, bu, bi = engine["X"], engine["Y"], engine["bu"], engine["bi"]
+    try:
+        for it in range(n_epochs):
+            t0 = time.perf_counter()
+            for s in rng.permutation(S):
+                seeds = rng.integers(2**32, size=S)
+                engine.starmap(_sgd_block, [
+                    (b * S + (b + s) % S, seeds[b], mu, lr, lam, lam_bias, batch_size) for b in range(S)
+                ])
+
+            if callback is not None:
+                loss = (_squared_error(R, R_rows, X, Y, mu + bu[R_rows] + bi[R.indices])
+                        + lam * (np.square(X).sum() + np.square(Y).sum())
+                        + lam_bias * (np.square(bu).sum() + np.square(bi).sum()))
+                if _report(callback, it, t0, loss, (mu, bu, bi, X, Y)):
+                    break
+
+        if X is not X_out:
+            X_out, Y_out, bu_out, bi_out = X.copy(), Y.copy(), bu.copy(), bi.copy()
+        del X, Y, bu, bi
+    finally:
+        engine.close()
+
+    return mu, bu_out, bi_out, X_out, Y_out
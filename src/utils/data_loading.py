@@ -1,3 +1,5 @@
+import os
+
 import pandas as pd
 from scipy import sparse
 import numpy as np
@@ -35,4 +37,103 @@ def load_split(base_path, test_path, mean_centered=False):
 
     return R_train, R_test, n_users, n_items, train, test, global_mean
 
-    
+
+def synthetic_split(n_users, n_items, nnz, rank=10, test_frac=0.2, noise=0.5, seed=0):
+    """
+    Random low-rank explicit ratings in [1, 5] with a long-tailed item
+    popularity, split into train/test CSR matrices of shape (n_users, n_items).
+    Used by the benchmarks to go beyond ml-100k.
+    """
+    rng = np.random.default_rng(seed)
+    users = rng.integers(0, n_users, nnz)
+    items = np.minimum((rng.pareto(1.2, nnz) * n_items / 20).astype(np.int64), n_items - 1)
+    items = rng.permutation(n_items)[items]
+
+    key = np.unique(users.astype(np.int64) * n_items + items)
+    users, items = key // n_items, key % n_items
+
+    P = rng.standard_normal((n_users, rank)) / np.sqrt(rank)
+    Q = rng.standard_normal((n_items, rank)) / np.sqrt(rank)
+    raw = 3.5 + np.sum(P[users] * Q[items], axis=1) + noise * rng.standard_normal(users.size)
+    ratings = np.clip(np.rint(raw), 1, 5)
+
+    test = rng.random(users.size) < test_frac
+
+    def to_csr(mask):
+        return sparse.coo_matrix((ratings[mask], (users[mask], items[mask])),
+                                 shape=(n_users, n_items)).tocsr()
+    return to_csr(~test), to_csr(test)
+
+
+def save_csr_npy(R, path):
+    """
+    Write a CSR matrix as indptr.npy / indices.npy / data.npy / shape.npy in
+    directory `path`, the layout read back (memory-mapped) by load_csr_npy.
+    """
+    os.makedirs(path, exist_ok=True)
+    R = R.tocsr()
+    R.sort_indices()
+    np.save(os.path.join(path, "indptr.npy"), R.indptr.astype(np.int64))
+    np.save(os.path.join(path, "indices.npy"), R.indices)
+    np.save(os.path.join(path, "data.npy"), R.data)
+    np.save(os.path.join(path, "shape.npy"), np.array(R.shape, dtype=np.int64))
+
+
+def load_csr_npy(path, mmap_mode="r"):
+    """
+    Open a directory written by save_csr_npy (or transpose_csr_npy).
+
+    Returns (indptr, indices, data, shape) with the three arrays memory-mapped,
+    so nothing is read until it is sliced.
+    """
+    indptr = np.load(os.path.join(path, "indptr.npy"), mmap_mode=mmap_mode)
+    indices = np.load(os.path.join(path, "indices.npy"), mmap_mode=mmap_mode)
+    data = np.load(os.path.join(path, "data.npy"), mmap_mode=mmap_mode)
+    shape = tuple(int(d) for d in np.load(os.path.join(path, "shape.npy")))
+    return indptr, indices, data, shape
+
+
+def transpose_csr_npy(src, dst, block_nnz=1 << 22):
+    """
+    Out-of-core transpose of the memory-mapped CSR in `src` into `dst` (e.g.
+    user-major -> item-major), reading at most `block_nnz` entries at a time.
+    Memory use is O(n_cols + block_nnz) regardless of the total nnz.
+    """
+    indptr, indices, data, (n_rows, n_cols) = load_csr_npy(src)
+    nnz = int(indptr[-1])
+
+    # pass 1: column counts -> transposed indptr
+    counts = np.zeros(n_cols, dtype=np.int64)
+    for s in range(0, nnz, block_nnz):
+        counts += np.bincount(indices[s:s+block_nnz], minlength=n_cols)
+    indptr_t = np.concatenate(([0], np.cumsum(counts)))
+
+    os.makedirs(dst, exist_ok=True)
+    np.save(os.path.join(dst, "indptr.npy"), indptr_t)
+    np.save(os.path.join(dst, "shape.npy"), np.array((n_cols, n_rows), dtype=np.int64))
+    index_dtype = np.int32 if n_rows <= np.iinfo(np.int32).max else np.int64
+    indices_t = np.lib.format.open_memmap(os.path.join(dst, "indices.npy"), mode="w+",
+                                          dtype=index_dtype, shape=(nnz,))
+    data_t = np.lib.format.open_memmap(os.path.join(dst, "data.npy"), mode="w+",
+                                       dtype=data.dtype, shape=(nnz,))
+
+    # pass 2: scatter row blocks in row order, so each output row stays sorted
+    fill = indptr_t[:-1].copy()
+    lo = 0
+    while lo < n_rows:
+        hi = max(int(np.searchsorted(indptr, indptr[lo] + block_nnz, side="right")) - 1, lo + 1)
+        hi = min(hi, n_rows)
+        s, e = int(indptr[lo]), int(indptr[hi])
+        cols = np.asarray(indices[s:e])
+        rows = np.repeat(np.arange(lo, hi), np.diff(np.asarray(indptr[lo:hi+1])))
+        order = np.argsort(cols, kind="stable")
+        cols_sorted = cols[order]
+        block_counts = np.bincount(cols_sorted, minlength=n_cols)
+        first = np.concatenate(([0], np.cumsum(block_counts)))[cols_sorted]
+        pos = fill[cols_sorted] + np.arange(cols_sorted.size) - first
+        indices_t[pos] = rows[order]
+        data_t[pos] = np.asarray(data[s:e])[order]
+        fill += block_counts
+        lo = hi
+    indices_t.flush()
+    data_t.flush()
@@ -0,0 +1,134 @@
+"""
+Hot loops of the sparse KNN predictors, over raw CSR arrays.
+
+Every kernel has a NumPy version and a plain-loop version. When numba is
+installed the loop versions are compiled and become the module-level
+names; otherwise the NumPy versions are used. Both give the same results.
+"""
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAS_NUMBA = numba is not None
+
+
+def _co_rated_moments_numpy(t_indptr, t_indices, t_data, cols, vals, n_rows):
+    # (6, n_rows) array of N, sum x, sum y, sum x^2, sum y^2, sum x*y over the
+    # columns co-rated by the row (cols, vals) and every row of the matrix
+    # whose transpose is (t_indptr, t_indices, t_data)
+    starts, ends = t_indptr[cols], t_indptr[cols + 1]
+    lengths = ends - starts
+    pos = np.repeat(ends - lengths.cumsum(), lengths) + np.arange(lengths.sum())
+    other = t_indices[pos]
+    x, y = np.repeat(vals, lengths), t_data[pos]
+    # (bincount of an empty row is int64 even with weights, hence the cast)
+    return np.stack([np.bincount(other, weights=w, minlength=n_rows)
+                     for w in (np.ones_like(x), x, y, x * x, y * y, x * y)]).astype(float, copy=False)
+
+
+def _co_rated_moments_loop(t_indptr, t_indices, t_data, cols, vals, n_rows):
+    out = np.zeros((6, n_rows))
+    for j in range(cols.size):
+        x = vals[j]
+        for p in range(t_indptr[cols[j]], t_indptr[cols[j] + 1]):
+            r, y = t_indices[p], t_data[p]
+            out[0, r] += 1.0
+            out[1, r] += x
+            out[2, r] += y
+            out[3, r] += x * x
+            out[4, r] += y * y
+            out[5, r] += x * y
+    return out
+
+
+def _paired_moments_numpy(indptr, indices, data, rows, cols):
+    # (6, n_pairs) array of the same moments as co_rated_moments, for the
+    # (rows[p], cols[p]) pairs of rows of the CSR matrix (indptr, indices,
+    # data) only. The distinct rows are laid out densely (NaN where nothing
+    # is stored) and every col row's entries are looked up in them.
+    own, slot = np.unique(rows, return_inverse=True)
+    n_cols = indices.max() + 1 if indices.size else 0
+    starts, ends = indptr[own], indptr[own + 1]
+    lengths = ends - starts
+    pos = np.repeat(ends - lengths.cumsum(), lengths) + np.arange(lengths.sum())
+    dense = np.full((own.size, n_cols), np.nan)
+    dense[np.repeat(np.arange(own.size), lengths), indices[pos]] = data[pos]
+    starts, ends = indptr[cols], indptr[cols + 1]
+    lengths = ends - starts
+    pos = np.repeat(ends - lengths.cumsum(), lengths) + np.arange(lengths.sum())
+    pair = np.repeat(np.arange(rows.size), lengths)
+    x, y = dense[slot.ravel()[pair], indices[pos]], data[pos]
+    both = ~np.isnan(x)
+    pair, x, y = pair[both], x[both], y[both]
+    return np.stack([np.bincount(pair, weights=w, minlength=rows.size)
+                     for w in (np.ones_like(x), x, y, x * x, y * y, x * y)]).astype(float, copy=False)
+
+
+def _paired_moments_loop(indptr, indices, data, rows, cols):
+    # merge the sorted column indices of the two rows of every pair
+    out = np.zeros((6, rows.size))
+    for p in range(rows.size):
+        a, a_end = indptr[rows[p]], indptr[rows[p] + 1]
+        b, b_end = indptr[cols[p]], indptr[cols[p] + 1]
+        while a < a_end and b < b_end:
+            if indices[a] < indices[b]:
+                a += 1
+            elif indices[a] > indices[b]:
+                b += 1
+            else:
+                x, y = data[a], data[b]
+                out[0, p] += 1.0
+                out[1, p] += x
+                out[2, p] += y
+                out[3, p] += x * x
+                out[4, p] += y * y
+                out[5, p] += x * y
+                a += 1
+                b += 1
+    return out
+
+
+def _top_k_average_numpy(others, sims, ratings, k):
+    # similarity-weighted average of the ratings of the k most similar
+    # others (sims > 0, ties to the lower index), NaN if there are none
+    top = np.lexsort((others, -sims))[:k]
+    if not top.size:
+        return np.nan
+    return np.sum(sims[top] * ratings[top]) / np.sum(sims[top])
+
+
+def _top_k_average_loop(others, sims, ratings, k):
+    # keep the best k in a buffer sorted by (-sim, other), by insertion
+    best = np.empty(k, dtype=np.int64)
+    n = 0
+    for j in range(others.size):
+        pos = n
+        while pos > 0 and (sims[j] > sims[best[pos - 1]] or
+                           (sims[j] == sims[best[pos - 1]] and others[j] < others[best[pos - 1]])):
+            pos -= 1
+        if pos >= k:
+            continue
+        for q in range(min(n, k - 1), pos, -1):
+            best[q] = best[q - 1]
+        best[pos] = j
+        n = min(n + 1, k)
+    if n == 0:
+        return np.nan
+    num, den = 0.0, 0.0
+    for q in range(n):
+        num += sims[best[q]] * ratings[best[q]]
+        den += sims[best[q]]
+    return num / den
+
+
+if HAS_NUMBA:
+    co_rated_moments = numba.njit(cache=True)(_co_rated_moments_loop)
+    paired_moments = numba.njit(cache=True)(_paired_moments_loop)
+    top_k_average = numba.njit(cache=True)(_top_k_average_loop)
+else:
+    co_rated_moments = _co_rated_moments_numpy
+    paired_moments = _paired_moments_numpy
+    top_k_average = _top_k_average_numpy
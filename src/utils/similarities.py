@@ -1,5 +1,22 @@
+import functools
+
 import numpy as np
+from scipy import sparse
+
+from src.utils import kernels
+
+def _accepts_csr(func):
+    # lets a scalar function take 1 x n sparse rows (stored entries are the
+    # rated ones), scored from their indices by the pairwise version
+    @functools.wraps(func)
+    def wrapper(u, v):
+        if sparse.issparse(u) or sparse.issparse(v):
+            u, v = (x if sparse.issparse(x) else np.reshape(x, (1, -1)) for x in (u, v))
+            return PAIRWISE[wrapper](u, v)[0, 0]
+        return func(u, v)
+    return wrapper
 
+@_accepts_csr
 def cosine_similarity(u, v):
     mask = ~np.isnan(u) & ~np.isnan(v)
     if np.sum(mask) == 0:
@@ -11,6 +28,7 @@ def cosine_similarity(u, v):
         return 0
     return np.dot(u_masked, v_masked)/(a*b)
 
+@_accepts_csr
 def euclidean_similarity(u, v):
     mask = ~np.isnan(u) & ~np.isnan(v)
     if np.sum(mask) == 0:
@@ -18,6 +36,7 @@ def euclidean_similarity(u, v):
     d = np.linalg.norm(u[mask] - v[mask])
     return 1 / (1 + d)
 
+@_accepts_csr
 def manhattan_similarity(u, v):
     mask = ~np.isnan(u) & ~np.isnan(v)
     if np.sum(mask) == 0:
@@ -25,6 +44,7 @@ def manhattan_similarity(u, v):
     d = np.sum(np.abs(u[mask] - v[mask]))
     return 1 / (1 + d)
 
+@_accepts_csr
 def pearson_similarity(u, v):
     mask = ~np.isnan(u) & ~np.isnan(v)
     if np.sum(mask) < 2:
@@ -40,6 +60,9 @@ def pearson_similarity(u, v):
     return num / denom
 
 def adjusted_cosine_similarity(i, j, users_items):
+    if sparse.issparse(users_items):
+        items_users = _as_csr(users_items).T.tocsr()
+        return pairwise_adjusted_cosine(items_users[[i]], items_users)[0, j]
     ratings_i = users_items[:, i]
     ratings_j = users_items[:, j]
 
@@ -52,12 +75,13 @@ def adjusted_cosine_similarity(i, j, users_items):
     ratings_j_adj = ratings_j[mask] - user_means[mask]
 
     num = np.dot(ratings_i_adj, ratings_j_adj)
-    denom = np.linalg.norm(ratings_i_adj) * np.linalg.norm(ratings_i_adj)
+    denom = np.linalg.norm(ratings_i_adj) * np.linalg.norm(ratings_j_adj)
 
     if denom == 0:
         return 0
     return num / denom
 
+@_accepts_csr
 def jaccard_similarity(a, b):
     mask = ~np.isnan(a) & ~np.isnan(b)
     a, b = a[mask], b[mask]
@@ -67,6 +91,7 @@ def jaccard_similarity(a, b):
         return 0
     return intersect / union
 
+@_accepts_csr
 def log_likelihood_similarity(a, b):
     mask = ~np.isnan(a) & ~np.isnan(b)
     a, b = a[mask], b[mask]
@@ -92,6 +117,7 @@ def log_likelihood_similarity(a, b):
     llr = 2 * (term(k11, E11) + term(k10, E10) + term(k01, E01) + term(k00, E00))
     return llr
 
+@_accepts_csr
 def tanimoto_similarity(a, b):
     mask = ~np.isnan(a) & ~np.isnan(b)
     a, b = a[mask], b[mask]
@@ -101,9 +127,601 @@ def tanimoto_similarity(a, b):
         return 0.0
     return num / denom
 
+@_accepts_csr
 def hamming_similarity(a, b):
     mask = ~np.isnan(a) & ~np.isnan(b)
     a, b = a[mask], b[mask]
     if len(a) == 0:
         return 0.0
-    return np.mean(a==b)
\ No newline at end of file
+    return np.mean(a==b)
+
+# ---------------------------------------------------------------------------
+# Pairwise versions. Each takes a ratings matrix X (rows = vectors, either a
+# dense array with NaN for missing values or a CSR matrix of stored ratings)
+# and an optional Y, and returns the CSR matrix of similarities between
+# every row of X and every row of Y, computed over co-rated columns exactly
+# like the scalar functions above. Pairs without co-rated columns are not
+# stored (their similarity is 0).
+# ---------------------------------------------------------------------------
+
+_TILE_BYTES = 1 << 27   # working memory for the dense tiles of pairwise sums
+
+def _as_csr(ratings):
+    # dense NaN matrix -> CSR that keeps rated zeros as explicit entries
+    if sparse.issparse(ratings):
+        R = sparse.csr_matrix(ratings, dtype=float, copy=True)
+        R.sum_duplicates()
+        return R
+    ratings = np.asarray(ratings, dtype=float)
+    rows, cols = np.nonzero(~np.isnan(ratings))
+    return sparse.csr_matrix((ratings[rows, cols], (rows, cols)), shape=ratings.shape)
+
+
+def _as_csr_pair(X, Y):
+    X = _as_csr(X)
+    return X, X if Y is None else _as_csr(Y)
+
+
+def _pattern(R):
+    return sparse.csr_matrix((np.ones_like(R.data), R.indices, R.indptr), shape=R.shape)
+
+
+def _tile_rows(n_cols, n_arrays):
+    # rows per tile so that n_arrays dense float64 tiles fit in _TILE_BYTES
+    return max(1, _TILE_BYTES // (8 * n_arrays * max(n_cols, 1)))
+
+
+def _one(v):
+    return np.ones_like(v)
+
+
+def _identity(v):
+    return v
+
+
+def _square(v):
+    return v * v
+
+
+def _is_one(v):
+    return (v == 1).astype(float)
+
+
+def _is_zero(v):
+    return (v == 0).astype(float)
+
+
+# Every pairwise similarity is a function of a few terms of the form
+#   sum over the co-rated columns of f(x) * g(y),
+# given as (f, g). The first term is 0 wherever a pair is not co-rated (and
+# the similarity is then set to 0). _MOMENTS gives N, sum x, sum y, sum x^2,
+# sum y^2 and sum x*y; a measure computes only the ones it uses.
+_MOMENTS = ((_one, _one), (_identity, _one), (_one, _identity),
+            (_square, _one), (_one, _square), (_identity, _identity))
+_N, _SX, _SY, _SXX, _SYY, _SXY = _MOMENTS
+
+
+def _is_moments(terms):
+    return terms is not None and all(t in _MOMENTS for t in terms)
+
+
+def _mapped(R, f, cache):
+    # f applied to the stored values of R, same sparsity pattern (so rated
+    # zeros still take part, e.g. in the counts)
+    if f not in cache:
+        cache[f] = sparse.csr_matrix((f(R.data), R.indices, R.indptr), shape=R.shape)
+    return cache[f]
+
+
+def _x_factors(X, terms):
+    # f(X) of every term, row-major
+    cache = {}
+    return [_mapped(X, f, cache) for f, _ in terms]
+
+
+def _y_factors(Y, terms):
+    # g(Y) of every term, transposed for the products of _tile_terms
+    cache = {}
+    for _, g in terms:
+        if g not in cache:
+            cache[g] = _mapped(Y, g, {}).T.tocsr()
+    return [cache[g] for _, g in terms]
+
+
+def _tile_terms(Xf, Ygt, lo, hi):
+    # the dense (hi - lo, n_y) terms of rows lo:hi, one sparse product each
+    return [(xf[lo:hi] @ ygt).toarray() for xf, ygt in zip(Xf, Ygt)]
+
+
+def _co_rated_tiles(X, Y, terms):
+    # yield (lo, hi, term_1, ..., term_t) for consecutive row tiles of X
+    Xf, Ygt = _x_factors(X, terms), _y_factors(Y, terms)
+    step = _tile_rows(Y.shape[0], len(terms) + 2)
+    for lo in range(0, X.shape[0], step):
+        hi = min(lo + step, X.shape[0])
+        yield (lo, hi, *_tile_terms(Xf, Ygt, lo, hi))
+
+
+def _paired_rows(X, Y, rows, cols):
+    # sorted, de-duplicated pairs that share at least one column, with the
+    # paired rows of X and Y restricted to their co-rated columns (XM, YM)
+    # and the co-rated mask M, all with M's row structure
+    key = np.sort(np.asarray(rows, dtype=np.int64) * Y.shape[0] + np.asarray(cols, dtype=np.int64))
+    key = key[np.concatenate(([True], key[1:] != key[:-1]))] if key.size else key
+    rows, cols = key // Y.shape[0], key % Y.shape[0]
+    M = _pattern(X[rows]).multiply(_pattern(Y[cols])).tocsr()
+    shared = np.diff(M.indptr) > 0
+    rows, cols, M = rows[shared], cols[shared], M[shared]
+    # M has sorted indices, so the co-rated values of each row can be read
+    # off X and Y by position instead of with more elementwise products
+    M_rows = np.repeat(rows, np.diff(M.indptr))
+    M_cols = np.repeat(cols, np.diff(M.indptr))
+    xm = _values_at(X, M_rows, M.indices)
+    ym = _values_at(Y, M_cols, M.indices)
+    return rows, cols, M, xm, ym
+
+
+def _values_at(R, rows, cols):
+    # R[rows, cols] for CSR R with sorted indices, every (row, col) stored
+    key_r = np.repeat(np.arange(R.shape[0], dtype=np.int64), np.diff(R.indptr)) * R.shape[1] + R.indices
+    return R.data[np.searchsorted(key_r, rows.astype(np.int64) * R.shape[1] + cols)]
+
+
+def _paired_terms(X, Y, rows, cols, terms):
+    # the same terms as _co_rated_tiles, for the given pairs only, from the
+    # co-rated values of each pair
+    rows, cols, M, xm, ym = _paired_rows(X, Y, rows, cols)
+    starts = M.indptr[:-1]
+
+    def row_sums(v):
+        return np.add.reduceat(v, starts) if v.size else np.zeros(rows.size)
+
+    return (rows, cols, *[row_sums(f(xm) * g(ym)) for f, g in terms])
+
+
+def _pairs_to_csr(rows, cols, values, shape):
+    # rows/cols sorted by (row, col) and unique, as _paired_rows returns them
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=shape[0]))))
+    out = sparse.csr_matrix((values, cols, indptr), shape=shape)
+    out.eliminate_zeros()
+    return out
+
+
+def _pairwise(X, Y, values, terms, pairs=None):
+    # similarity matrix from co-rated terms; values(*terms) maps the terms
+    # (dense tiles or per-pair vectors) to similarities. values=None is
+    # manhattan, which is not term-based.
+    if values is None:
+        return _pairwise_manhattan(X, Y, pairs)
+    if pairs is not None:
+        rows, cols, *sums = _paired_terms(X, Y, *pairs, terms)
+        return _pairs_to_csr(rows, cols, values(*sums), (X.shape[0], Y.shape[0]))
+    tiles = []
+    for lo, hi, *sums in _co_rated_tiles(X, Y, terms):
+        sim = values(*sums)
+        sim[sums[0] == 0] = 0
+        tiles.append(sparse.csr_matrix(sim))
+    if not tiles:
+        return sparse.csr_matrix((X.shape[0], Y.shape[0]))
+    return sparse.vstack(tiles, format="csr")
+
+
+def _dense_tile(X, Y, values, terms):
+    # dense similarities between the rows of X and Y (0 where not co-rated),
+    # for tiles small enough to hold
+    if values is None:
+        return _pairwise_manhattan(X, Y, None).toarray()
+    out = np.zeros((X.shape[0], Y.shape[0]))
+    for lo, hi, *sums in _co_rated_tiles(X, Y, terms):
+        sim = values(*sums)
+        sim[sums[0] == 0] = 0
+        out[lo:hi] = sim
+    return out
+
+
+def _safe_divide(num, den):
+    return np.divide(num, den, out=np.zeros_like(num), where=den > 0)
+
+
+def _cosine_values(Sxx, Syy, Sxy):
+    return _safe_divide(Sxy, np.sqrt(Sxx) * np.sqrt(Syy))
+
+
+def _pearson_values(N, Sx, Sy, Sxx, Syy, Sxy):
+    n = np.maximum(N, 1)
+    num = Sxy - Sx * Sy / n
+    var_x, var_y = Sxx - Sx ** 2 / n, Syy - Sy ** 2 / n
+    # constant vectors have zero variance; don't let rounding make it positive
+    eps = 1e-12
+    var_x[var_x <= eps * Sxx] = 0
+    var_y[var_y <= eps * Syy] = 0
+    sim = _safe_divide(num, np.sqrt(var_x) * np.sqrt(var_y))
+    sim[N < 2] = 0
+    return sim
+
+
+def _euclidean_values(N, Sxx, Syy, Sxy):
+    return 1 / (1 + np.sqrt(np.maximum(Sxx + Syy - 2 * Sxy, 0)))
+
+
+def _adjusted_cosine_values(N, Sxx, Syy, Sxy):
+    sim = _cosine_values(Sxx, Syy, Sxy)
+    sim[N < 2] = 0
+    return sim
+
+
+def _row_centered(R):
+    # Pearson is invariant to shifting a vector, so subtract each row's mean
+    # first; it keeps the sums small and the variances accurate
+    counts = np.diff(R.indptr)
+    means = np.bincount(np.repeat(np.arange(R.shape[0]), counts), weights=R.data,
+                        minlength=R.shape[0]) / np.maximum(counts, 1)
+    return sparse.csr_matrix((R.data - np.repeat(means, counts), R.indices, R.indptr), shape=R.shape)
+
+
+def _prepare_cosine(X, Y):
+    return X, Y, _cosine_values, (_SXX, _SYY, _SXY)
+
+
+def _prepare_pearson(X, Y):
+    Xc = _row_centered(X)
+    return Xc, Xc if Y is X else _row_centered(Y), _pearson_values, _MOMENTS
+
+
+def _prepare_euclidean(X, Y):
+    return X, Y, _euclidean_values, (_N, _SXX, _SYY, _SXY)
+
+
+def _prepare_manhattan(X, Y):
+    return X, Y, None, None
+
+
+def _prepare_adjusted_cosine(X, Y):
+    # rows are items, columns users; center by the user means over Y
+    counts = np.bincount(Y.indices, minlength=Y.shape[1])
+    user_means = np.bincount(Y.indices, weights=Y.data, minlength=Y.shape[1]) / np.maximum(counts, 1)
+
+    def centered(R):
+        return sparse.csr_matrix((R.data - user_means[R.indices], R.indices, R.indptr), shape=R.shape)
+
+    Xc = centered(X)
+    return Xc, Xc if Y is X else centered(Y), _adjusted_cosine_values, (_N, _SXX, _SYY, _SXY)
+
+
+def _jaccard_values(N, k11, ones_x, ones_y):
+    return _safe_divide(k11, ones_x + ones_y - k11)
+
+
+def _prepare_jaccard(X, Y):
+    return X, Y, _jaccard_values, ((_one, _one), (_is_one, _is_one), (_is_one, _one), (_one, _is_one))
+
+
+def _llr_values(N, k11, k10, k01, k00):
+    n = k11 + k10 + k01 + k00
+    row1, row2, col1, col2 = k11 + k10, k01 + k00, k11 + k01, k10 + k00
+    llr = np.zeros_like(n)
+    for k, e in ((k11, row1 * col1), (k10, row1 * col2), (k01, row2 * col1), (k00, row2 * col2)):
+        # k * log(k / E) with E = e / n; E > 0 wherever k > 0
+        ok = k > 0
+        llr[ok] += k[ok] * np.log(k[ok] * n[ok] / e[ok])
+    return 2 * llr
+
+
+def _prepare_log_likelihood(X, Y):
+    return X, Y, _llr_values, ((_one, _one), (_is_one, _is_one), (_is_one, _is_zero), (_is_zero, _is_one), (_is_zero, _is_zero))
+
+
+def _tanimoto_values(Sxx, Syy, Sxy):
+    return _safe_divide(Sxy, Sxx + Syy - Sxy)
+
+
+def _prepare_tanimoto(X, Y):
+    return X, Y, _tanimoto_values, (_SXX, _SYY, _SXY)
+
+
+def _equals(value):
+    def indicator(v):
+        return (v == value).astype(float)
+    return indicator
+
+
+def _hamming_values(N, *equal):
+    return _safe_divide(sum(equal, np.zeros_like(N)), N)
+
+
+def _prepare_hamming(X, Y):
+    # fraction of co-rated columns with equal values: one indicator term per
+    # distinct value, so meant for small value sets (binary, 1-5 stars)
+    levels = np.unique(np.concatenate([X.data, Y.data]))
+    return X, Y, _hamming_values, ((_one, _one),) + tuple((_equals(v),) * 2 for v in levels)
+
+
+def _pairwise_manhattan(X, Y, pairs):
+    # |x - y| does not factor into products, so gather, per row of X, the
+    # entries of Y on that row's columns and sum the differences per y
+    if pairs is not None:
+        rows, cols, M, xm, ym = _paired_rows(X, Y, *pairs)
+        dist = np.add.reduceat(np.abs(xm - ym), M.indptr[:-1]) if xm.size else np.zeros(rows.size)
+        return _pairs_to_csr(rows, cols, 1 / (1 + dist), (X.shape[0], Y.shape[0]))
+    Yt = Y.T.tocsr()
+    n_y = Yt.shape[1]
+    rows, cols, vals = [], [], []
+    for r in range(X.shape[0]):
+        idx = X.indices[X.indptr[r]:X.indptr[r+1]]
+        x = X.data[X.indptr[r]:X.indptr[r+1]]
+        starts, ends = Yt.indptr[idx], Yt.indptr[idx + 1]
+        lengths = ends - starts
+        if not lengths.sum():
+            continue
+        pos = np.repeat(ends - lengths.cumsum(), lengths) + np.arange(lengths.sum())
+        other = Yt.indices[pos]
+        dist = np.bincount(other, weights=np.abs(np.repeat(x, lengths) - Yt.data[pos]), minlength=n_y)
+        seen = np.bincount(other, minlength=n_y) > 0
+        rows.append(np.full(seen.sum(), r))
+        cols.append(np.flatnonzero(seen))
+        vals.append(1 / (1 + dist[seen]))
+    if not rows:
+        return sparse.csr_matrix((X.shape[0], n_y))
+    return sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=(X.shape[0], n_y))
+
+
+def pairwise_cosine(X, Y=None, pairs=None):
+    return _pairwise(*_prepare_cosine(*_as_csr_pair(X, Y)), pairs)
+
+
+def pairwise_pearson(X, Y=None, pairs=None):
+    return _pairwise(*_prepare_pearson(*_as_csr_pair(X, Y)), pairs)
+
+
+def pairwise_euclidean(X, Y=None, pairs=None):
+    return _pairwise(*_prepare_euclidean(*_as_csr_pair(X, Y)), pairs)
+
+
+def pairwise_manhattan(X, Y=None, pairs=None):
+    return _pairwise(*_prepare_manhattan(*_as_csr_pair(X, Y)), pairs)
+
+
+def pairwise_adjusted_cosine(X, Y=None, pairs=None):
+    """
+    adjusted_cosine_similarity between all rows of X and Y (default X), where
+    rows are items and columns users: each rating is centered by its user's
+    mean over the items of Y, then compared by cosine over the users who
+    rated both items, 0 when fewer than two did. For a block of rows of the
+    full item matrix, pass the full matrix as Y.
+    """
+    return _pairwise(*_prepare_adjusted_cosine(*_as_csr_pair(X, Y)), pairs)
+
+
+def pairwise_jaccard(X, Y=None, pairs=None):
+    return _pairwise(*_prepare_jaccard(*_as_csr_pair(X, Y)), pairs)
+
+
+def pairwise_log_likelihood(X, Y=None, pairs=None):
+    return _pairwise(*_prepare_log_likelihood(*_as_csr_pair(X, Y)), pairs)
+
+
+def pairwise_tanimoto(X, Y=None, pairs=None):
+    return _pairwise(*_prepare_tanimoto(*_as_csr_pair(X, Y)), pairs)
+
+
+def pairwise_hamming(X, Y=None, pairs=None):
+    return _pairwise(*_prepare_hamming(*_as_csr_pair(X, Y)), pairs)
+
+
+PAIRWISE = {
+    cosine_similarity: pairwise_cosine,
+    pearson_similarity: pairwise_pearson,
+    euclidean_similarity: pairwise_euclidean,
+    manhattan_similarity: pairwise_manhattan,
+    # rows are items here, like the columns of adjusted_cosine_similarity's
+    # users_items argument
+    adjusted_cosine_similarity: pairwise_adjusted_cosine,
+    jaccard_similarity: pairwise_jaccard,
+    log_likelihood_similarity: pairwise_log_likelihood,
+    tanimoto_similarity: pairwise_tanimoto,
+    hamming_similarity: pairwise_hamming,
+}
+
+_PREPARE = {
+    cosine_similarity: _prepare_cosine,
+    pearson_similarity: _prepare_pearson,
+    euclidean_similarity: _prepare_euclidean,
+    manhattan_similarity: _prepare_manhattan,
+    adjusted_cosine_similarity: _prepare_adjusted_cosine,
+    jaccard_similarity: _prepare_jaccard,
+    log_likelihood_similarity: _prepare_log_likelihood,
+    tanimoto_similarity: _prepare_tanimoto,
+    hamming_similarity: _prepare_hamming,
+}
+
+
+def pairwise_similarity(X, Y=None, similarity_func=cosine_similarity, pairs=None, rows=None):
+    """
+    Similarity matrix between the rows of X and the rows of Y (default X)
+    for one of the scalar similarity functions in this module. For
+    adjusted_cosine_similarity the rows are items (pass users_items.T).
+
+    rows=... computes only that block of rows of the result (its rows are
+    X[rows]); pairs=(rows, cols) computes only those (x, y) pairs, e.g.
+    candidates from an approximate neighbour index, and stores just them.
+    """
+    if similarity_func not in PAIRWISE:
+        raise ValueError(f"no pairwise version of {getattr(similarity_func, '__name__', similarity_func)}")
+    if rows is not None:
+        X = _as_csr(X)
+        X, Y = X[rows], X if Y is None else Y
+    return PAIRWISE[similarity_func](X, Y, pairs)
+
+
+def _prepare_similarity_row(R, similarity_func):
+    # the part of _similarity_row that depends only on the CSR matrix R:
+    # the prepared matrix and its transpose. Build it once per matrix and
+    # similarity function and pass it to every _similarity_row call.
+    if similarity_func not in _PREPARE:
+        raise ValueError(f"no pairwise version of {getattr(similarity_func, '__name__', similarity_func)}")
+    X, _, values, terms = _PREPARE[similarity_func](R, R)
+    if not _is_moments(terms):
+        return R, None, None, similarity_func
+    Xt = X.T.tocsr()
+    # cost of a whole similarity row, per moment: the number of ratings of
+    # every column the row rated
+    row_cost = np.bincount(np.repeat(np.arange(X.shape[0]), np.diff(X.indptr)),
+                           weights=np.diff(Xt.indptr)[X.indices], minlength=X.shape[0])
+    return X, Xt, values, similarity_func, [_MOMENTS.index(t) for t in terms], row_cost
+
+
+def _similarity_row(prepared, row):
+    # similarities of one row to every row, from _prepare_similarity_row.
+    # Moment-based measures gather the co-rated moments through the columns
+    # of the row (kernels.co_rated_moments); the rest go through
+    # pairwise_similarity.
+    X, Xt, values, similarity_func, *used = prepared
+    if Xt is None:
+        return pairwise_similarity(X, similarity_func=similarity_func, rows=[row]).toarray()[0]
+    used = used[0]
+    lo, hi = X.indptr[row], X.indptr[row + 1]
+    moments = kernels.co_rated_moments(Xt.indptr, Xt.indices, Xt.data, X.indices[lo:hi], X.data[lo:hi], X.shape[0])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sims = values(*moments[used])
+    sims[moments[0] == 0] = 0
+    return sims
+
+
+def _similarity_block(prepared, rows):
+    # _similarity_row for several rows, (len(rows), n_rows). Moment-based
+    # measures run the kernel row by row on the prepared state; the rest
+    # take one pairwise_similarity call for the whole block.
+    X, Xt, values, similarity_func, *_ = prepared
+    if Xt is None:
+        return pairwise_similarity(X, similarity_func=similarity_func, rows=rows).toarray()
+    out = np.empty((len(rows), X.shape[0]))
+    for i, row in enumerate(rows):
+        out[i] = _similarity_row(prepared, row)
+    return out
+
+
+def _top_n_mask(D, n):
+    # mask of the n largest positive entries of every row of the dense block
+    # D, ties going to the earlier column
+    positive = D > 0
+    if n >= D.shape[1]:
+        return positive
+    kth = np.partition(D, D.shape[1] - n, axis=1)[:, D.shape[1] - n]
+    above = D > kth[:, None]
+    tie = positive & (D == kth[:, None])
+    need = n - above.sum(axis=1)
+    return (above & positive) | (tie & (np.cumsum(tie, axis=1) <= need[:, None]))
+
+
+def _top_n_entries(rows, cols, sims, n_neighbors):
+    # the n_neighbors largest positive off-diagonal (row, col, sim) entries
+    # of every row, as (sims, (rows, cols))
+    keep = (sims > 0) & (rows != cols)
+    rows, cols, sims = rows[keep], cols[keep], sims[keep]
+    order = np.lexsort((cols, -sims, rows))
+    rows, cols, sims = rows[order], cols[order], sims[order]
+    keep = np.arange(rows.size) - np.searchsorted(rows, rows) < n_neighbors
+    return (sims[keep], (rows[keep], cols[keep]))
+
+
+def _top_n_candidates(prepared, rows, cols, n_neighbors):
+    # _top_n_entries over the (rows[p], cols[p]) candidate pairs (rows
+    # sorted, no self pairs), scored from the state of
+    # _prepare_similarity_row. Moment-based measures take the cheaper of two
+    # ways: paired_moments, which looks up each candidate's entries (cost:
+    # the candidates' row lengths), or whole similarity rows from one sparse
+    # product per moment, as in the tiles of top_n_similarities (cost: the
+    # popularity of every column the rows rated, per moment), which are then
+    # masked to the candidates and cut with _top_n_mask. Per unit, a paired
+    # lookup measures about 10x a moment of the products.
+    X, Xt, values, similarity_func, *rest = prepared
+    block, slot = np.unique(rows, return_inverse=True)
+    slot = slot.ravel()
+    if Xt is None:
+        sims = _similarity_block(prepared, block)
+    else:
+        used, row_cost = rest
+        if 10 * np.diff(X.indptr)[cols].sum() < len(used) * row_cost[block].sum():
+            moments = kernels.paired_moments(X.indptr, X.indices, X.data, rows, cols)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                sims = values(*moments[used])
+            sims[moments[0] == 0] = 0
+            return _top_n_entries(rows, cols, sims, n_neighbors)
+        # g commutes with the transpose, so g(X).T is g mapped over Xt
+        Xb, x_cache, y_cache = X[block], {}, {}
+        moments = [(_mapped(Xb, f, x_cache) @ _mapped(Xt, g, y_cache)).toarray()
+                   for f, g in (_MOMENTS[u] for u in used)]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sims = values(*moments)
+        sims[moments[0] == 0] = 0
+    candidates = np.zeros_like(sims)
+    candidates[slot, cols] = sims[slot, cols]
+    r, c = np.nonzero(_top_n_mask(candidates, n_neighbors))
+    return candidates[r, c], (block[r], c)
+
+
+def top_n_similarities(X, Y=None, similarity_func=cosine_similarity, n_neighbors=50, max_memory=1 << 28):
+    """
+    For every row of X, its `n_neighbors` most similar rows of Y (default X,
+    in which case a row is not its own neighbour) with positive similarity,
+    as an (n_x, n_y) CSR matrix. Ties go to the lower index.
+
+    The similarities are computed in (row tile x column tile) blocks sized
+    so the dense working set stays within about `max_memory` bytes, and each
+    block is merged into a running top-N per row, so the full similarity
+    matrix is never formed.
+    """
+    if similarity_func not in _PREPARE:
+        raise ValueError(f"no pairwise version of {getattr(similarity_func, '__name__', similarity_func)}")
+    same = Y is None
+    X, Y, values, terms = _PREPARE[similarity_func](*_as_csr_pair(X, Y))
+    n_x, n_y = X.shape[0], Y.shape[0]
+    n = min(n_neighbors, n_y)
+
+    # whole rows when 64 of them fit, otherwise column tiles of 64 rows
+    cells = max(max_memory // (8 * ((len(terms) if terms else 1) + 4)), 1)
+    col_step = n_y if n_y * 64 <= cells else max(cells // 64, 1)
+    row_step = max(cells // max(col_step + n, 1), 1)
+
+    # the term factors depend only on X and on the column tile, so they are
+    # built once here and reused by every row tile
+    col_tiles = [(clo, min(clo + col_step, n_y)) for clo in range(0, n_y, col_step)]
+    if values is not None:
+        Xf = _x_factors(X, terms)
+        Ygt = [_y_factors(Y[clo:chi], terms) for clo, chi in col_tiles]
+
+    counts, indices, data = [], [], []
+    for lo in range(0, n_x, row_step):
+        hi = min(lo + row_step, n_x)
+        rows = np.arange(hi - lo)
+        best_val = np.zeros((hi - lo, 0))
+        best_idx = np.zeros((hi - lo, 0), dtype=np.int64)
+        for t, (clo, chi) in enumerate(col_tiles):
+            if values is None:
+                sim = _dense_tile(X[lo:hi], Y[clo:chi], values, terms)
+            else:
+                sums = _tile_terms(Xf, Ygt[t], lo, hi)
+                sim = values(*sums)
+                sim[sums[0] == 0] = 0
+            if same:
+                own = (rows + lo >= clo) & (rows + lo < chi)
+                sim[rows[own], rows[own] + lo - clo] = 0
+            # candidates: the current best (lower column indices, in order)
+            # followed by this tile; keep the top n and pack them left
+            cand_val = np.hstack([best_val, sim])
+            cand_idx = np.hstack([best_idx, np.broadcast_to(np.arange(clo, chi), sim.shape)])
+            r, c = np.nonzero(_top_n_mask(cand_val, n))
+            slot = np.arange(r.size) - np.searchsorted(r, r)
+            best_val = np.zeros((hi - lo, n))
+            best_idx = np.zeros((hi - lo, n), dtype=np.int64)
+            best_val[r, slot] = cand_val[r, c]
+            best_idx[r, slot] = cand_idx[r, c]
+        found = best_val > 0
+        counts.append(found.sum(axis=1))
+        indices.append(best_idx[found])
+        data.append(best_val[found])
+    if not counts:
+        return sparse.csr_matrix((n_x, n_y))
+    indptr = np.concatenate(([0], np.cumsum(np.concatenate(counts))))
+    return sparse.csr_matrix((np.concatenate(data), np.concatenate(indices), indptr), shape=(n_x, n_y))
@@ -1,8 +1,9 @@
 import pandas as pd
+import pytest
 import numpy as np
 from scipy.sparse import csr_matrix
 
-from src.content_based_baseline import compute_user_profiles
+from src.content_based_baseline import ContentScorer, GenreSignatureIndex, compute_content_scores, compute_user_profiles
 
 def test_compute_user_profiles_simple():
     item_cols = ['f1', 'f2']
@@ -30,4 +31,53 @@ def test_compute_user_profiles_simple():
     actual = compute_user_profiles(R, items, item_cols)
 
     
-    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
\ No newline at end of file
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+@pytest.mark.filterwarnings("ignore:invalid value encountered in divide")
+def test_content_scorer_matches_dense():
+    rng = np.random.default_rng(0)
+    ratings = rng.integers(1, 6, (12, 30)) * (rng.random((12, 30)) < 0.3)
+    ratings[5] = 0                                      # user without ratings
+    R = csr_matrix(ratings.astype(float))
+    genres = csr_matrix((rng.random((30, 4)) < 0.4).astype(float))
+    expected = compute_content_scores(R, genres)
+
+    scorer = ContentScorer(R, genres)
+    np.testing.assert_allclose(scorer.score_users(np.arange(12)), expected)
+    np.testing.assert_allclose(scorer.score_users([3, 7]), expected[[3, 7]])
+
+    top = scorer.topk(k=5, block_users=5)
+    assert top.shape == (12, 5)
+    masked = np.where(ratings > 0, -np.inf, expected)
+    for u in range(12):
+        assert not set(top[u]) & set(R[u].indices)
+        np.testing.assert_allclose(masked[u, top[u]], np.sort(masked[u])[::-1][:5])
+
+
+def test_genre_signature_index():
+    rng = np.random.default_rng(1)
+    # 40 items over 5 distinct signatures
+    signatures = (rng.random((5, 6)) < 0.5).astype(float)
+    genres = csr_matrix(signatures[rng.integers(0, 5, 40)])
+    index = GenreSignatureIndex(genres)
+    assert len(index.signatures) <= 5
+    np.testing.assert_array_equal(index.signatures[index.group_of], genres.toarray())
+
+    profiles = rng.random((8, 6))
+    seen = csr_matrix((rng.random((8, 40)) < 0.5).astype(float))
+    top = index.topk(profiles, seen, k=7)
+    scores = np.where(seen.toarray() > 0, -np.inf, profiles @ genres.toarray().T)
+    for u in range(8):
+        assert not set(top[u]) & set(seen[u].indices)
+        assert len(set(top[u])) == 7
+        np.testing.assert_allclose(scores[u, top[u]], np.sort(scores[u])[::-1][:7])
+
+    # fewer unseen items than k
+    top = index.topk(profiles[:1], csr_matrix(np.ones((1, 40)) - np.eye(1, 40)), k=3)
+    np.testing.assert_array_equal(top, [[0, -1, -1]])
+
+    # a zero profile ties every item: signature by signature, lower id first
+    top = index.topk(np.zeros((1, 6)), seen[:1], k=7)
+    expected = [i for i in index.members if i not in set(seen[0].indices)][:7]
+    np.testing.assert_array_equal(top, [expected])
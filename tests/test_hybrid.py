@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from src.content_based_baseline import ContentScorer, compute_content_scores
+from src.hybrid import compute_cf_scores, evaluate_hybrid, stream_topk_hybrid, sweep_hybrid, topk_hybrid
+
+def test_stream_topk_hybrid_matches_dense():
+    rng = np.random.default_rng(0)
+    n_users, n_items, k = 23, 40, 5
+    R = csr_matrix(rng.integers(1, 6, (n_users, n_items)) * (rng.random((n_users, n_items)) < 0.3))
+    genres = csr_matrix((rng.random((n_items, 6)) < 0.4).astype(float))
+    mu, bu, bi = 3.5, rng.normal(size=n_users), rng.normal(size=n_items)
+    X, Y = rng.normal(size=(n_users, 4)), rng.normal(size=(n_items, 4))
+
+    cf = compute_cf_scores(mu, bu, bi, X, Y)
+    content = compute_content_scores(R, genres)
+    expected = topk_hybrid(R, cf, content, 0.3, k)
+    blocks = list(stream_topk_hybrid(R, mu, bu, bi, X, Y, ContentScorer(R, genres), 0.3, k, block_users=6))
+    assert [users[0] for users, _ in blocks] == [0, 6, 12, 18]
+    np.testing.assert_array_equal(np.vstack([top for _, top in blocks]), expected)
+
+def test_sweep_matches_evaluate_hybrid():
+    rng = np.random.default_rng(1)
+    n_users, n_items = 30, 50
+    R = rng.integers(1, 6, (n_users, n_items)) * (rng.random((n_users, n_items)) < 0.3)
+    R_train = csr_matrix(R * (rng.random(R.shape) < 0.7))
+    R_test = csr_matrix(R * (R_train.toarray() == 0))
+    genre_cols = [f"genre_{g}" for g in range(5)]
+    items = pd.DataFrame((rng.random((n_items, 5)) < 0.4).astype(int), columns=genre_cols)
+    items.insert(0, "movie_id", np.arange(1, n_items + 1))
+    mu, bu, bi = 3.5, rng.normal(size=n_users), rng.normal(size=n_items)
+    X, Y = rng.normal(size=(n_users, 4)), rng.normal(size=(n_items, 4))
+
+    alphas, ks = [0.2, 0.7, 1.0], [3, 8]
+    table = sweep_hybrid(R_train, R_test, mu, bu, bi, X, Y, items, genre_cols, alphas, ks, block_users=7)
+    assert len(table) == len(alphas) * len(ks)
+    for row in table.itertuples():
+        expected = evaluate_hybrid(R_train, R_test, mu, bu, bi, X, Y, items, genre_cols, alpha=row.alpha, k=row.k)
+        for name, value in expected.items():
+            assert getattr(row, name) == value
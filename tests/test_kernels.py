@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from src.utils import kernels
+
+@pytest.fixture(scope="module")
+def csr_ratings():
+    R = sp.random(40, 25, density=0.3, random_state=1, format="csr")
+    R.data = np.round(1 + 4 * R.data)
+    return R
+
+def _moment_args(R, row):
+    Rt = R.T.tocsr()
+    lo, hi = R.indptr[row], R.indptr[row + 1]
+    return Rt.indptr, Rt.indices, Rt.data, R.indices[lo:hi], R.data[lo:hi], R.shape[0]
+
+def _top_k_cases():
+    rng = np.random.default_rng(2)
+    for n, k in [(0, 3), (5, 10), (30, 4), (30, 1)]:
+        others = rng.permutation(50)[:n]
+        # few distinct values so that ties are common
+        sims = rng.integers(1, 4, n) / 4
+        yield others, sims, rng.integers(1, 6, n).astype(float), k
+
+def test_loop_kernels_match_numpy(csr_ratings):
+    for row in (0, 7, 39):
+        args = _moment_args(csr_ratings, row)
+        np.testing.assert_allclose(kernels._co_rated_moments_loop(*args), kernels._co_rated_moments_numpy(*args))
+    for case in _top_k_cases():
+        np.testing.assert_allclose(kernels._top_k_average_loop(*case), kernels._top_k_average_numpy(*case), equal_nan=True)
+
+def test_paired_moments_match_row_moments(csr_ratings):
+    rows = np.repeat([0, 7, 39], 40)
+    cols = np.tile(np.arange(40), 3)
+    expected = np.hstack([kernels._co_rated_moments_numpy(*_moment_args(csr_ratings, r)) for r in (0, 7, 39)])
+    R = csr_ratings
+    for kernel in (kernels._paired_moments_numpy, kernels._paired_moments_loop):
+        np.testing.assert_allclose(kernel(R.indptr, R.indices, R.data, rows, cols), expected)
+
+def test_moments_of_an_empty_row(csr_ratings):
+    args = _moment_args(csr_ratings, 0)
+    args = args[:3] + (args[3][:0], args[4][:0], args[5])
+    for kernel in (kernels._co_rated_moments_numpy, kernels._co_rated_moments_loop):
+        M = kernel(*args)
+        assert M.dtype == np.float64 and M.shape == (6, 40) and not M.any()
+
+def test_moments_against_dense(csr_ratings):
+    D = csr_ratings.toarray()
+    stored = D != 0
+    M = kernels._co_rated_moments_numpy(*_moment_args(csr_ratings, 3))
+    both = stored[3] & stored
+    np.testing.assert_allclose(M[0], both.sum(axis=1))
+    np.testing.assert_allclose(M[5], (D[3] * D * both).sum(axis=1))
+
+def test_numba_kernels_match_numpy(csr_ratings):
+    numba = pytest.importorskip("numba")
+    jit_moments = numba.njit(kernels._co_rated_moments_loop)
+    jit_pairs = numba.njit(kernels._paired_moments_loop)
+    jit_top_k = numba.njit(kernels._top_k_average_loop)
+    args = _moment_args(csr_ratings, 5)
+    np.testing.assert_allclose(jit_moments(*args), kernels._co_rated_moments_numpy(*args))
+    R, rows, cols = csr_ratings, np.repeat([3, 5], 40), np.tile(np.arange(40), 2)
+    pair_args = (R.indptr, R.indices, R.data, rows, cols)
+    np.testing.assert_allclose(jit_pairs(*pair_args), kernels._paired_moments_numpy(*pair_args))
+    for case in _top_k_cases():
+        np.testing.assert_allclose(jit_top_k(*case), kernels._top_k_average_numpy(*case), equal_nan=True)
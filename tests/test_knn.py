@@ -1,6 +1,8 @@
 import numpy as np
-from src.utils.similarities import cosine_similarity, pearson_similarity
-from src.knn import knn_predict_user, knn_predict_item
+import pytest
+import scipy.sparse as sp
+from src.utils.similarities import adjusted_cosine_similarity, cosine_similarity, euclidean_similarity, jaccard_similarity, log_likelihood_similarity, manhattan_similarity, pairwise_similarity, pearson_similarity, tanimoto_similarity
+from src.knn import RatingsIndex, fit_item_knn, fit_related_items, fit_user_knn, knn_predict_item, knn_predict_item_batch, knn_predict_user, knn_predict_user_batch, recommend_item_knn
 
 ratings_matrix = np.array([
     [5, 3, np.nan, 1],
@@ -36,4 +38,150 @@ def test_knn_user_no_neighbors():
     tmp = ratings_matrix.copy()
     tmp[4, 2] = np.nan
     pred = knn_predict_user(tmp, user_id=2, item_id=2, k=2, similarity_func=cosine_similarity)
-    assert np.isnan(pred)
\ No newline at end of file
+    assert np.isnan(pred)
+
+@pytest.fixture(scope="module")
+def random_ratings():
+    # continuous ratings so that no two similarities tie
+    rng = np.random.default_rng(0)
+    R = 1 + 4 * rng.random((30, 20))
+    R[rng.random(R.shape) > 0.7] = np.nan
+    R[7] = np.nan                                       # user without ratings
+    return R
+
+@pytest.mark.parametrize("similarity_func", [cosine_similarity, pearson_similarity, euclidean_similarity, manhattan_similarity])
+def test_fitted_user_knn_matches_scan(random_ratings, similarity_func):
+    S = fit_user_knn(random_ratings, similarity_func, n_neighbors=30)
+    for u in range(30):
+        for i in range(20):
+            expected = knn_predict_user(random_ratings, u, i, k=4, similarity_func=similarity_func)
+            pred = knn_predict_user(random_ratings, u, i, k=4, neighbours=S)
+            assert np.isclose(pred, expected, equal_nan=True)
+
+def test_fit_user_knn_truncates_rows(random_ratings):
+    S = fit_user_knn(random_ratings, cosine_similarity, n_neighbors=5)
+    assert S.shape == (30, 30)
+    assert np.all(np.diff(S.indptr) <= 5)
+    assert S.diagonal().sum() == 0
+    assert np.all(S.data > 0)
+    full = fit_user_knn(random_ratings, cosine_similarity, n_neighbors=30).toarray()
+    for u in range(30):
+        kept = S[u].toarray().ravel()
+        assert np.all(full[u][kept == 0].max(initial=0) <= kept[kept > 0].min(initial=np.inf))
+
+@pytest.mark.parametrize("similarity_func", [cosine_similarity, pearson_similarity, manhattan_similarity, tanimoto_similarity])
+def test_batch_predictions_match_scalar(random_ratings, similarity_func):
+    rng = np.random.default_rng(1)
+    users, items = rng.integers(0, 30, 200), rng.integers(0, 20, 200)
+    expected = [knn_predict_user(random_ratings, u, i, k=3, similarity_func=similarity_func) for u, i in zip(users, items)]
+    preds = knn_predict_user_batch(random_ratings, users, items, k=3, similarity_func=similarity_func, block_users=7)
+    np.testing.assert_allclose(preds, expected, equal_nan=True)
+
+    expected = [knn_predict_item(random_ratings, u, i, k=3, similarity_func=similarity_func) for u, i in zip(users, items)]
+    preds = knn_predict_item_batch(random_ratings, users, items, k=3, similarity_func=similarity_func)
+    np.testing.assert_allclose(preds, expected, equal_nan=True)
+
+def test_batch_with_neighbours(random_ratings):
+    S = fit_user_knn(random_ratings, cosine_similarity, n_neighbors=4)
+    users, items = np.repeat(np.arange(30), 20), np.tile(np.arange(20), 30)
+    expected = [knn_predict_user(random_ratings, u, i, k=3, neighbours=S) for u, i in zip(users, items)]
+    np.testing.assert_allclose(knn_predict_user_batch(random_ratings, users, items, k=3, neighbours=S), expected, equal_nan=True)
+
+@pytest.mark.parametrize("similarity_func", [cosine_similarity, pearson_similarity])
+def test_fitted_item_knn_matches_scan(random_ratings, similarity_func):
+    S = fit_item_knn(random_ratings, similarity_func, n_neighbors=20)
+    assert S.shape == (20, 20)
+    assert S.indices.dtype == np.int32 and S.data.dtype == np.float32
+    for u in range(30):
+        for i in range(20):
+            expected = knn_predict_item(random_ratings, u, i, k=4, similarity_func=similarity_func)
+            pred = knn_predict_item(random_ratings, u, i, k=4, neighbours=S)
+            assert np.isclose(pred, expected, rtol=1e-5, equal_nan=True)
+
+def test_recommend_item_knn(random_ratings):
+    rows, cols = np.nonzero(~np.isnan(random_ratings))
+    R = sp.csr_matrix((random_ratings[rows, cols], (rows, cols)), shape=random_ratings.shape)
+    S = fit_item_knn(R, adjusted_cosine_similarity, n_neighbors=5)
+    assert np.all(np.diff(S.indptr) <= 5)
+    recs = recommend_item_knn(R, S, k=3, block_users=8)
+    assert recs.shape == (30, 3)
+
+    scores = R.toarray() @ S.toarray().T
+    scores[rows, cols] = -np.inf
+    for u in range(30):
+        assert not set(recs[u]) & set(R[u].indices)
+        np.testing.assert_allclose(scores[u, recs[u]], np.sort(scores[u])[::-1][:3], rtol=1e-6)
+
+def test_fit_item_knn_rejects_other_similarities(random_ratings):
+    with pytest.raises(ValueError):
+        fit_item_knn(random_ratings, euclidean_similarity)
+
+@pytest.mark.parametrize("similarity_func", [cosine_similarity, pearson_similarity, manhattan_similarity])
+def test_csr_input_matches_dense(random_ratings, similarity_func):
+    rows, cols = np.nonzero(~np.isnan(random_ratings))
+    R = sp.csr_matrix((random_ratings[rows, cols], (rows, cols)), shape=random_ratings.shape)
+    S_user = fit_user_knn(R, similarity_func, n_neighbors=6)
+    for u in range(0, 30, 3):
+        for i in range(20):
+            expected = knn_predict_user(random_ratings, u, i, k=3, similarity_func=similarity_func)
+            assert np.isclose(knn_predict_user(R, u, i, k=3, similarity_func=similarity_func), expected, equal_nan=True)
+            expected = knn_predict_item(random_ratings, u, i, k=3, similarity_func=similarity_func)
+            assert np.isclose(knn_predict_item(R, u, i, k=3, similarity_func=similarity_func), expected, equal_nan=True)
+            expected = knn_predict_user(random_ratings, u, i, k=3, neighbours=S_user)
+            assert np.isclose(knn_predict_user(R, u, i, k=3, neighbours=S_user), expected, equal_nan=True)
+
+    users, items = np.repeat(np.arange(30), 20), np.tile(np.arange(20), 30)
+    for predict in (knn_predict_user_batch, knn_predict_item_batch):
+        np.testing.assert_allclose(predict(R, users, items, k=3, similarity_func=similarity_func),
+                                   predict(random_ratings, users, items, k=3, similarity_func=similarity_func), equal_nan=True)
+
+@pytest.mark.parametrize("similarity_func", [cosine_similarity, pearson_similarity, manhattan_similarity])
+def test_ratings_index_matches_csr(random_ratings, similarity_func):
+    rows, cols = np.nonzero(~np.isnan(random_ratings))
+    R = sp.csr_matrix((random_ratings[rows, cols], (rows, cols)), shape=random_ratings.shape)
+    index = RatingsIndex(R)
+    assert index.T.T is index
+    for u in range(0, 30, 3):
+        for i in range(20):
+            for predict in (knn_predict_user, knn_predict_item):
+                assert np.isclose(predict(index, u, i, k=3, similarity_func=similarity_func),
+                                  predict(R, u, i, k=3, similarity_func=similarity_func), equal_nan=True)
+    users, items = np.repeat(np.arange(30), 20), np.tile(np.arange(20), 30)
+    for predict in (knn_predict_user_batch, knn_predict_item_batch):
+        np.testing.assert_allclose(predict(index, users, items, k=3, similarity_func=similarity_func),
+                                   predict(R, users, items, k=3, similarity_func=similarity_func), equal_nan=True)
+
+@pytest.mark.parametrize("similarity_func", [jaccard_similarity, log_likelihood_similarity, tanimoto_similarity])
+def test_related_items_match_pairwise(similarity_func):
+    # on a complete 0/1 matrix the scalar functions count exactly the
+    # co-occurrence table
+    rng = np.random.default_rng(0)
+    D = (rng.random((40, 15)) < 0.3).astype(float)
+    top = fit_related_items(sp.csr_matrix(D), similarity_func, n_neighbors=4, block_items=4)
+    assert top.indices.dtype == np.int32 and top.data.dtype == np.float32
+
+    full = pairwise_similarity(D.T, similarity_func=similarity_func).toarray()
+    full[D.T @ D == 0] = 0
+    np.fill_diagonal(full, 0)
+    expected = np.zeros_like(full)
+    for i, row in enumerate(full):
+        order = np.lexsort((np.arange(row.size), -row))[:4]
+        order = order[row[order] > 0]
+        expected[i, order] = row[order]
+    np.testing.assert_allclose(top.toarray(), expected, rtol=1e-6)
+
+@pytest.mark.parametrize("similarity_func", [jaccard_similarity, log_likelihood_similarity, tanimoto_similarity])
+def test_related_items_dense_matches_csr(similarity_func):
+    rng = np.random.default_rng(1)
+    D = (rng.random((40, 8)) < 0.3).astype(float)
+    D[0, :3] = np.nan                                   # missing, not an interaction
+    dense = fit_related_items(D, similarity_func, n_neighbors=3)
+    csr = fit_related_items(sp.csr_matrix(np.nan_to_num(D)), similarity_func, n_neighbors=3)
+    np.testing.assert_array_equal(dense.toarray(), csr.toarray())
+
+def test_csr_predict_for_user_without_ratings(random_ratings):
+    ratings = random_ratings.copy()
+    ratings[4] = np.nan
+    rows, cols = np.nonzero(~np.isnan(ratings))
+    R = sp.csr_matrix((ratings[rows, cols], (rows, cols)), shape=ratings.shape)
+    assert np.isnan(knn_predict_user(R, 4, 0, k=3, similarity_func=cosine_similarity))
@@ -0,0 +1,95 @@
+import numpy as np
+import scipy.sparse as sp
+
+from src.knn import fit_user_knn
+from src.utils.lsh import HyperplaneLSH
+from src.utils.similarities import cosine_similarity, pearson_similarity
+
+
+def clustered_ratings(n_clusters=5, per_cluster=20, n_items=60, seed=0):
+    # users in a cluster share a taste profile, so their rows point the same way
+    rng = np.random.default_rng(seed)
+    profiles = rng.normal(size=(n_clusters, n_items))
+    R = np.repeat(profiles, per_cluster, axis=0) + 0.1 * rng.normal(size=(n_clusters * per_cluster, n_items))
+    R[rng.random(R.shape) < 0.3] = np.nan
+    return R
+
+
+def test_candidate_pairs_are_symmetric_and_exclude_self():
+    R = clustered_ratings()
+    rows, cols = HyperplaneLSH(n_tables=4, n_bits=6, seed=1).fit(R).candidate_pairs()
+    assert rows.size > 0
+    assert not np.any(rows == cols)
+    keys = set(zip(rows.tolist(), cols.tolist()))
+    assert len(keys) == rows.size
+    assert all((c, r) in keys for r, c in keys)
+
+
+def test_max_bucket_bounds_candidates():
+    R = np.ones((50, 10))                               # every row in one bucket
+    rows, _ = HyperplaneLSH(n_tables=2, n_bits=4, max_bucket=5, center=False).fit(R).candidate_pairs()
+    assert np.bincount(rows).max() <= 2 * 4
+
+
+def test_lsh_neighbours_recover_clusters():
+    R = clustered_ratings()
+    exact = fit_user_knn(R, cosine_similarity, n_neighbors=10)
+    approx = fit_user_knn(R, cosine_similarity, n_neighbors=10, index=HyperplaneLSH(n_tables=8, n_bits=4, seed=0))
+    recall = exact.multiply(approx > 0).nnz / exact.nnz
+    assert recall > 0.9
+    # similarities of the pairs found are exact
+    found = approx.tocoo()
+    np.testing.assert_allclose(found.data, [cosine_similarity(R[r], R[c]) for r, c in zip(found.row, found.col)])
+    # users of a cluster are neighbours of each other
+    assert np.all(found.row // 20 == found.col // 20)
+
+
+def test_sparse_input_matches_dense():
+    R = clustered_ratings()
+    rows, cols = np.nonzero(~np.isnan(R))
+    csr = sp.csr_matrix((R[rows, cols], (rows, cols)), shape=R.shape)
+    a = HyperplaneLSH(seed=3).fit(R).candidate_pairs()
+    b = HyperplaneLSH(seed=3).fit(csr).candidate_pairs()
+    np.testing.assert_array_equal(a[0], b[0])
+    np.testing.assert_array_equal(a[1], b[1])
+
+
+def test_fit_leaves_sparse_input_unchanged():
+    R = clustered_ratings()
+    rows, cols = np.nonzero(~np.isnan(R))
+    csr = sp.csr_matrix((R[rows, cols], (rows, cols)), shape=R.shape)
+    before = csr.data.copy()
+    HyperplaneLSH(seed=3).fit(csr)
+    np.testing.assert_array_equal(csr.data, before)
+
+
+class FixedPairs:
+    # an index proposing a fixed set of candidate pairs
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+    def fit(self, X):
+        return self
+
+    def candidate_pairs(self):
+        return self.pairs
+
+
+def test_candidates_are_scored_exactly():
+    R = clustered_ratings()
+    n = R.shape[0]
+    # every pair: whole similarity rows, the same graph as the exact fit
+    rows, cols = np.nonzero(~np.eye(n, dtype=bool))
+    exact = fit_user_knn(R, pearson_similarity, n_neighbors=5)
+    approx = fit_user_knn(R, pearson_similarity, n_neighbors=5, index=FixedPairs((rows, cols)))
+    np.testing.assert_array_equal(approx.indices, exact.indices)
+    np.testing.assert_allclose(approx.data, exact.data)
+    # two candidates per row: paired lookups
+    rows = np.repeat(np.arange(n), 2)
+    cols = (rows + np.tile([1, 2], n)) % n
+    approx = fit_user_knn(R, pearson_similarity, n_neighbors=1, index=FixedPairs((rows, cols))).tocoo()
+    sims = np.array([pearson_similarity(R[r], R[c]) for r, c in zip(rows, cols)]).reshape(n, 2)
+    best = np.argmax(sims, axis=1)
+    keep = sims.max(axis=1) > 0
+    np.testing.assert_array_equal(approx.col, cols.reshape(n, 2)[np.arange(n), best][keep])
+    np.testing.assert_allclose(approx.data, sims.max(axis=1)[keep])
@@ -1,5 +1,6 @@
 import pytest
 import numpy as np
+from scipy.sparse import csr_matrix
 
 from src.metrics.metrics import (
     hr_at_k,
@@ -8,9 +9,10 @@ from src.metrics.metrics import (
     ndcg_at_k,
     user_coverage,
     item_coverage,
+    ranking_metrics,
 )
 
-from src.metrics.evaluate import evaluate
+from src.metrics.evaluate import _ground_truth, evaluate, rmse_XY, topk_preds, topk_preds_biased
 
 
 predicted = [
@@ -73,4 +75,51 @@ def test_evaluate_all_metrics():
     assert ev["precision"] == pytest.approx(2/9)
     assert ev["recall"] == pytest.approx(0.5)
     assert ev["user_coverage"] == pytest.approx(2/3)
-    assert ev["item_coverage"] == pytest.approx(5/6)
\ No newline at end of file
+    assert ev["item_coverage"] == pytest.approx(5/6)
+
+def test_rmse_XY():
+    X = np.array([[1.0, 0.0], [0.0, 2.0]])
+    Y = np.array([[1.0, 1.0], [2.0, 0.0]])
+    R_test = csr_matrix(np.array([[2.0, 0.0], [0.0, 1.0]]))
+    # predictions 1 and 0 -> errors 1 and 1
+    assert rmse_XY(R_test, X, Y) == pytest.approx(1.0)
+    bu, bi = np.array([1.0, 0.5]), np.array([0.0, 0.5])
+    # predictions 1 + 0 + 1 = 2 and 0 + 0.5 + 0.5 = 1 -> no error
+    assert rmse_XY(R_test, X, Y, biased=True, bu=bu, bi=bi, mu=0.0) == pytest.approx(0.0)
+
+
+def test_topk_float32_matches_float64():
+    rng = np.random.default_rng(0)
+    X, Y = rng.standard_normal((6, 3)), rng.standard_normal((8, 3))
+    bu, bi = rng.standard_normal(6), rng.standard_normal(8)
+    R_train = csr_matrix((rng.random((6, 8)) < 0.3).astype(float))
+    expected = topk_preds_biased(R_train, 0.5, bu, bi, X, Y, 3)
+    assert np.array_equal(topk_preds_biased(R_train, 0.5, bu, bi, X, Y, 3, dtype=np.float32), expected)
+    assert topk_preds(R_train, X, Y, 3, dtype=np.float32) == topk_preds(R_train, X, Y, 3)
+
+
+@pytest.mark.parametrize("k", [1, 3, 10])
+def test_ranking_metrics_match_loops(k):
+    rng = np.random.default_rng(k)
+    n_users, n_items = 60, 90
+    relevant = rng.random((n_users, n_items)) < 0.08
+    relevant[5] = False                                 # user without test items
+    truth = csr_matrix(relevant.astype(float))
+    preds = np.array([rng.permutation(n_items)[:10] for _ in range(n_users)])
+    sets = _ground_truth(truth)
+    expected = {
+        "hr":            hr_at_k(preds, sets, k),
+        "precision":     precision_at_k(preds, sets, k),
+        "recall":        recall_at_k(preds, sets, k),
+        "ndcg":          ndcg_at_k(preds, sets, k),
+        "user_coverage": user_coverage(preds),
+        "item_coverage": item_coverage(preds, n_items),
+    }
+    assert ranking_metrics(preds, truth, k, n_items) == expected
+
+
+@pytest.mark.parametrize("preds", [[], np.empty((0, 5), dtype=np.int64)])
+def test_ranking_metrics_no_users(preds):
+    truth = csr_matrix((0, 7))
+    assert ranking_metrics(preds, truth, 3, 7) == {
+        "hr": 0.0, "precision": 0.0, "recall": 0.0, "ndcg": 0.0, "user_coverage": 0.0, "item_coverage": 0.0}
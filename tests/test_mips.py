@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from src import mips
+from src.mips import MIPSIndex
+
+@pytest.fixture(scope="module")
+def factors():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(20, 6))
+    # long-tailed item norms, as ALS gives for popular items
+    Y = rng.normal(size=(300, 6)) * rng.pareto(2.0, (300, 1))
+    return X, Y, rng.normal(size=20), rng.normal(size=300)
+
+def _brute_force(X, Y, bu, bi, mu, user, k, exclude):
+    scores = mu + bu[user] + bi + Y @ X[user]
+    scores[exclude] = -np.inf
+    top = np.argsort(-scores, kind="stable")[:k]
+    return top, scores[top]
+
+@pytest.mark.parametrize("biased", [False, True])
+def test_exact_mode_matches_brute_force(factors, biased):
+    X, Y, bu, bi = factors
+    if not biased:
+        bu, bi = np.zeros_like(bu), np.zeros_like(bi)
+    index = MIPSIndex(X, Y, bu=bu, bi=bi, mu=3.0, n_clusters=12)
+    rng = np.random.default_rng(1)
+    for user in range(20):
+        exclude = rng.choice(300, 30, replace=False)
+        items, scores = index.recommend(user, k=10, exclude=exclude)
+        expected_items, expected_scores = _brute_force(X, Y, bu, bi, 3.0, user, 10, exclude)
+        np.testing.assert_array_equal(items, expected_items)
+        np.testing.assert_allclose(scores, expected_scores)
+        assert not set(items) & set(exclude)
+
+def test_approximate_mode_scans_less(factors):
+    X, Y, bu, bi = factors
+    index = MIPSIndex(X, Y, bu=bu, bi=bi, n_clusters=12)
+    items, _ = index.recommend(0, k=5, n_probe=1)
+    assert index.last_scanned < 300
+    assert len(items) == min(5, index.last_scanned)
+    # visiting every cluster is exact
+    items, _ = index.recommend(0, k=5, n_probe=12)
+    np.testing.assert_array_equal(items, _brute_force(X, Y, bu, bi, 0.0, 0, 5, [])[0])
+
+@pytest.mark.parametrize("n_probe", [None, 3])
+def test_batch_matches_single_queries(factors, n_probe):
+    X, Y, bu, bi = factors
+    index = MIPSIndex(X, Y, bu=bu, bi=bi, mu=3.0, n_clusters=12, n_buckets=3)
+    rng = np.random.default_rng(2)
+    seen = sp.random(20, 300, density=0.1, format="csr", random_state=rng)
+    users = np.array([3, 0, 7, 19, 3])
+    items, scores = index.recommend_batch(users, k=10, exclude=seen, n_probe=n_probe)
+    for row, user in enumerate(users):
+        expected_items, expected_scores = index.recommend(user, k=10, exclude=seen[user].indices, n_probe=n_probe)
+        np.testing.assert_array_equal(items[row, :len(expected_items)], expected_items)
+        np.testing.assert_allclose(scores[row, :len(expected_items)], expected_scores)
+        assert np.all(items[row, len(expected_items):] == -1)
+    if n_probe is None:
+        for row, user in enumerate(users):
+            np.testing.assert_array_equal(items[row], _brute_force(X, Y, bu, bi, 3.0, user, 10, seen[user].indices)[0])
+
+def test_kmeans_chunks_do_not_change_the_index(factors, monkeypatch):
+    X, Y, bu, bi = factors
+    whole = MIPSIndex(X, Y, bu=bu, bi=bi, n_clusters=12)
+    monkeypatch.setattr(mips, "_KMEANS_CELLS", 7)
+    chunked = MIPSIndex(X, Y, bu=bu, bi=bi, n_clusters=12)
+    np.testing.assert_array_equal(chunked.members, whole.members)
+    np.testing.assert_allclose(chunked.centers, whole.centers)
@@ -0,0 +1,44 @@
+import numpy as np
+import scipy.sparse as sp
+import pytest
+
+from src.metrics.evaluate import evaluate_XY, rmse_XY
+from src.sgd import train_sgd_biased_mf
+
+
+@pytest.fixture(scope="module")
+def ratings():
+    rng = np.random.default_rng(0)
+    X0, Y0 = rng.normal(size=(60, 3)), rng.normal(size=(40, 3))
+    R = sp.random(60, 40, density=0.3, random_state=1, format="csr")
+    coo = R.tocoo()
+    R.data = 3 + np.sum(X0[coo.row] * Y0[coo.col], axis=1)
+    return R
+
+
+def test_loss_decreases(ratings):
+    losses = []
+    train_sgd_biased_mf(ratings, k=3, lr=0.02, n_epochs=15, n_strata=3, callback=lambda info: losses.append(info["loss"]))
+    assert len(losses) == 15
+    assert losses[-1] < 0.5 * losses[0]
+    assert np.all(np.diff(losses[3:]) < 0)
+
+
+def test_fits_training_ratings(ratings):
+    mu, bu, bi, X, Y = train_sgd_biased_mf(ratings, k=3, lr=0.03, lam=0.001, lam_bias=0.001, n_epochs=150, batch_size=16)
+    assert np.isclose(mu, ratings.data.mean())
+    assert rmse_XY(ratings, X, Y, biased=True, bu=bu, bi=bi, mu=mu) < 0.1
+
+
+def test_n_jobs_matches_single_process(ratings):
+    ref = train_sgd_biased_mf(ratings, k=3, n_epochs=3, n_strata=2, n_jobs=1)
+    out = train_sgd_biased_mf(ratings, k=3, n_epochs=3, n_strata=2, n_jobs=2)
+    for a, b in zip(ref, out):
+        np.testing.assert_allclose(a, b, atol=1e-12)
+
+
+def test_output_works_with_biased_evaluation(ratings):
+    mu, bu, bi, X, Y = train_sgd_biased_mf(ratings, k=3, n_epochs=2, dtype=np.float32)
+    assert X.dtype == Y.dtype == bu.dtype == bi.dtype == np.float32
+    res = evaluate_XY(ratings, ratings, X, Y, k=5, biased=True, bu=bu, bi=bi, mu=mu)
+    assert 0.0 <= res["ndcg"] <= 1.0
@@ -1,6 +1,8 @@
 import numpy as np
+import pytest
+import scipy.sparse as sp
 
-from src.utils.similarities import adjusted_cosine_similarity, euclidean_similarity, hamming_similarity, jaccard_similarity, cosine_similarity, log_likelihood_similarity, manhattan_similarity, pearson_similarity, tanimoto_similarity
+from src.utils.similarities import adjusted_cosine_similarity, euclidean_similarity, hamming_similarity, jaccard_similarity, cosine_similarity, log_likelihood_similarity, manhattan_similarity, pairwise_similarity, pearson_similarity, tanimoto_similarity, top_n_similarities
 
 def test_cosine_similarity():
     a = np.array([1, 0, 1, np.nan])
@@ -74,6 +76,16 @@ def test_adjusted_cosine_similarity():
     ])
     assert adjusted_cosine_similarity(0, 1, users_items) == 0
 
+    users_items = np.array([
+        [4, 2, 3],
+        [1, 5, 3],
+        [2, 2, 5],
+    ], dtype=float)
+    centered = users_items - users_items.mean(axis=1, keepdims=True)
+    a, b = centered[:, 0], centered[:, 1]
+    expected = a @ b / (np.linalg.norm(a) * np.linalg.norm(b))
+    assert np.isclose(adjusted_cosine_similarity(0, 1, users_items), expected)
+
 def test_jaccard_similarity():
     a = np.array([1, 0, 1, 1])
     b = np.array([1, 1, 0, 1])
@@ -137,4 +149,102 @@ def test_hamming_similarity():
 
     a = np.array([1, np.nan, 0])
     b = np.array([1, 1, 0])
-    assert np.isclose(hamming_similarity(a, b), 1.0)
\ No newline at end of file
+    assert np.isclose(hamming_similarity(a, b), 1.0)
+
+@pytest.fixture(scope="module")
+def nan_ratings():
+    rng = np.random.default_rng(0)
+    R = rng.integers(0, 6, (25, 15)).astype(float)
+    R[rng.random(R.shape) < 0.5] = np.nan
+    R[3] = np.nan                                       # no ratings
+    R[4, ~np.isnan(R[4])] = 2.0                         # constant ratings
+    return R
+
+@pytest.fixture(scope="module")
+def nan_binary():
+    rng = np.random.default_rng(1)
+    B = rng.integers(0, 2, (25, 15)).astype(float)
+    B[rng.random(B.shape) < 0.3] = np.nan
+    return B
+
+ROW_SIMILARITIES = [cosine_similarity, pearson_similarity, euclidean_similarity, manhattan_similarity,
+                    jaccard_similarity, log_likelihood_similarity, tanimoto_similarity, hamming_similarity]
+
+@pytest.mark.parametrize("data", ["nan_ratings", "nan_binary"])
+@pytest.mark.parametrize("similarity_func", ROW_SIMILARITIES)
+def test_pairwise_matches_scalar(request, data, similarity_func):
+    R = request.getfixturevalue(data)
+    expected = np.array([[similarity_func(a, b) for b in R] for a in R])
+    S = pairwise_similarity(R, similarity_func=similarity_func)
+    assert sp.issparse(S)
+    np.testing.assert_allclose(S.toarray(), expected, atol=1e-12)
+
+    # CSR input (rated zeros stored explicitly) and a second matrix
+    rows, cols = np.nonzero(~np.isnan(R))
+    S = pairwise_similarity(sp.csr_matrix((R[rows, cols], (rows, cols)), shape=R.shape), similarity_func=similarity_func)
+    np.testing.assert_allclose(S.toarray(), expected, atol=1e-12)
+    S = pairwise_similarity(R[:10], R[10:], similarity_func=similarity_func)
+    np.testing.assert_allclose(S.toarray(), expected[:10, 10:], atol=1e-12)
+
+@pytest.mark.parametrize("similarity_func", ROW_SIMILARITIES)
+def test_pairwise_blocks_and_pairs(nan_ratings, similarity_func):
+    R = nan_ratings
+    full = pairwise_similarity(R, similarity_func=similarity_func).toarray()
+    block = pairwise_similarity(R, similarity_func=similarity_func, rows=slice(5, 12))
+    np.testing.assert_allclose(block.toarray(), full[5:12])
+
+    rng = np.random.default_rng(2)
+    rows, cols = rng.integers(0, 25, 100), rng.integers(0, 25, 100)
+    picked = pairwise_similarity(R, similarity_func=similarity_func, pairs=(rows, cols)).toarray()
+    mask = np.zeros_like(full, dtype=bool)
+    mask[rows, cols] = True
+    np.testing.assert_allclose(picked, np.where(mask, full, 0), atol=1e-12)
+
+def test_pairwise_unsupported_function():
+    with pytest.raises(ValueError):
+        pairwise_similarity(np.ones((2, 2)), similarity_func=np.dot)
+
+@pytest.mark.filterwarnings("ignore:Mean of empty slice")
+def test_pairwise_adjusted_cosine_matches_scalar(nan_ratings):
+    R = nan_ratings
+    expected = np.array([[adjusted_cosine_similarity(i, j, R) for j in range(R.shape[1])] for i in range(R.shape[1])])
+    S = pairwise_similarity(R.T, similarity_func=adjusted_cosine_similarity)
+    np.testing.assert_allclose(S.toarray(), expected, atol=1e-12)
+    S = pairwise_similarity(R.T, similarity_func=adjusted_cosine_similarity, rows=[2, 7, 9])
+    np.testing.assert_allclose(S.toarray(), expected[[2, 7, 9]], atol=1e-12)
+
+def _reference_top_n(S, n):
+    # n largest positive entries per row, ties to the lower column
+    top = np.zeros_like(S)
+    for r, row in enumerate(S):
+        order = np.lexsort((np.arange(row.size), -row))[:n]
+        order = order[row[order] > 0]
+        top[r, order] = row[order]
+    return top
+
+@pytest.mark.parametrize("similarity_func", ROW_SIMILARITIES + [adjusted_cosine_similarity])
+@pytest.mark.parametrize("max_memory", [1 << 28, 20000, 2000])
+def test_top_n_similarities_matches_full(nan_ratings, similarity_func, max_memory):
+    # tiny budgets force many row and column tiles
+    R = nan_ratings
+    full = pairwise_similarity(R, similarity_func=similarity_func).toarray()
+    np.fill_diagonal(full, 0)
+    top = top_n_similarities(R, similarity_func=similarity_func, n_neighbors=4, max_memory=max_memory)
+    assert sp.isspmatrix_csr(top)
+    np.testing.assert_allclose(top.toarray(), _reference_top_n(full, 4))
+
+    cross = pairwise_similarity(R[:10], R, similarity_func=similarity_func).toarray()
+    top = top_n_similarities(R[:10], R, similarity_func=similarity_func, n_neighbors=30, max_memory=max_memory)
+    np.testing.assert_allclose(top.toarray(), _reference_top_n(cross, 30))
+
+@pytest.mark.filterwarnings("ignore:Mean of empty slice")
+@pytest.mark.parametrize("similarity_func", ROW_SIMILARITIES)
+def test_scalar_accepts_csr_rows(nan_ratings, similarity_func):
+    R = nan_ratings
+    rows, cols = np.nonzero(~np.isnan(R))
+    C = sp.csr_matrix((R[rows, cols], (rows, cols)), shape=R.shape)
+    for a, b in [(0, 1), (2, 9), (3, 5), (4, 4)]:
+        expected = similarity_func(R[a], R[b])
+        assert np.isclose(similarity_func(C[a], C[b]), expected)
+        assert np.isclose(similarity_func(C[a], R[b]), expected)
+    assert np.isclose(adjusted_cosine_similarity(0, 1, C), adjusted_cosine_similarity(0, 1, R))